@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Food filter micro-benchmark
+Times the compiled keyword pattern behind is_food_product against the old
+per-keyword `keyword in name` loop on recorded product names (plus a name
+built around every keyword, so both paths see non-food hits), and checks
+they classify every name the same way. --extra-keywords adds synthetic
+keywords to both to show how each scales with the keyword count.
+
+Usage:
+    python benchmark_food_filter.py
+    python benchmark_food_filter.py --names 50000 --extra-keywords 0 100 1000 --output filter-bench.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime
+
+from filter_food_products import NON_FOOD_KEYWORDS, SUSPICIOUS_PATTERNS, compile_keywords, non_food_keyword
+from jsonl_io import load_jsonl
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA = os.path.join(SCRIPTS_DIR, "data", "*.jsonl")
+
+def legacy_is_food_product(product_name, keywords=NON_FOOD_KEYWORDS):
+    """is_food_product as it was: a substring scan per keyword, then the suspicious patterns"""
+    name_upper = product_name.upper()
+    for keyword in keywords:
+        if keyword in name_upper:
+            return False
+    if any(pattern in name_upper for pattern in SUSPICIOUS_PATTERNS):
+        return False
+    return True
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark the compiled non-food keyword pattern against the old loop')
+    parser.add_argument('--data', nargs='+', default=[DEFAULT_DATA], help='JSONL files or globs with recorded products')
+    parser.add_argument('--names', type=int, default=20000, help='Names to classify per pass (recycled; default: 20000)')
+    parser.add_argument('--extra-keywords', type=int, nargs='+', default=[0, 1000],
+                        help='Synthetic keywords added to the list, one run per value (default: 0 1000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes per path; the best one counts (default: 3)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic keywords (default: 1)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    return parser.parse_args()
+
+def load_names(patterns: list) -> list:
+    names = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            names.extend(record['name'] for record in load_jsonl(path)
+                         if isinstance(record, dict) and record.get('name'))
+    # Non-food hits for both paths: every keyword inside an otherwise ordinary name
+    names.extend(f"Rema {keyword.lower()} 2 stk" for keyword in dict.fromkeys(NON_FOOD_KEYWORDS))
+    return names
+
+def synthetic_keywords(count: int, rng: random.Random) -> list:
+    """Upper-case nonsense words that never occur in real names"""
+    return [''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(5, 12))) + 'Ø'
+            for _ in range(count)]
+
+def best_time(function, names: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for name in names:
+            function(name)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    args = parse_arguments()
+    names = load_names(args.data)
+    if not names:
+        print(f"❌ No product names found in {args.data}")
+        return 1
+    names = [names[index % len(names)] for index in range(max(args.names, len(names)))]
+    rng = random.Random(args.seed)
+    print(f"🧪 {len(names)} names per pass, best of {args.repeat}")
+
+    results = []
+    for extra in args.extra_keywords:
+        keywords = NON_FOOD_KEYWORDS + synthetic_keywords(extra, rng)
+        pattern = compile_keywords(keywords + SUSPICIOUS_PATTERNS)
+
+        def legacy(name):
+            return legacy_is_food_product(name, keywords)
+
+        def compiled(name):
+            return non_food_keyword(name, pattern) is None
+
+        legacy_seconds = best_time(legacy, names, args.repeat)
+        compiled_seconds = best_time(compiled, names, args.repeat)
+        mismatches = sum(1 for name in names if legacy(name) != compiled(name))
+        results.append({
+            'keywords': len(keywords) + len(SUSPICIOUS_PATTERNS),
+            'unique_keywords': len(set(keywords + SUSPICIOUS_PATTERNS)),
+            'names': len(names),
+            'non_food': sum(1 for name in names if not compiled(name)),
+            'legacy_us': round(legacy_seconds / len(names) * 1e6, 3),
+            'compiled_us': round(compiled_seconds / len(names) * 1e6, 3),
+            'speedup': round(legacy_seconds / compiled_seconds, 2) if compiled_seconds else 0.0,
+            'mismatches': mismatches
+        })
+
+    print(f"\n{'keywords':>9} {'unique':>7} {'non-food':>9} {'loop µs':>8} {'pattern µs':>11} {'speedup':>8} {'mismatches':>11}")
+    for result in results:
+        print(f"{result['keywords']:>9} {result['unique_keywords']:>7} {result['non_food']:>9} {result['legacy_us']:>8} "
+              f"{result['compiled_us']:>11} {result['speedup']:>7}x {result['mismatches']:>11}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'results': results}, f, indent=2)
+        print(f"📁 Results saved to: {args.output}")
+
+    return 0 if all(result['mismatches'] == 0 for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
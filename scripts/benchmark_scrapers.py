@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Scraper benchmark
+Runs rema_scraper.py and zyte-rema-scraper.py end to end against the local
+mock server (mock_rema_server.py) and reports wall time, throughput and
+p50/p99 request latency per scraper mode, so changes can be measured offline.
+The import-* modes run import_to_supabase.py against the mock's import route
+and PostgREST endpoints and count the rows that landed.
+
+Usage:
+    python benchmark_scrapers.py
+    python benchmark_scrapers.py --modes full delta --latency 30 --jitter 20 --error-rate 0.02
+    python benchmark_scrapers.py --modes zyte --zyte-latency 500 --output bench.json
+    python benchmark_scrapers.py --modes import-api import-rest --import-latency 20 --rest-latency 50
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from jsonl_io import open_jsonl
+from mock_rema_server import DEFAULT_DATA, IMPORT_ROUTE, MockRemaServer, load_records
+from supabase_bulk import PRODUCTS_TABLE
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REMA_SCRAPER = os.path.join(SCRIPTS_DIR, "rema_scraper.py")
+ZYTE_SCRAPER = os.path.join(SCRIPTS_DIR, "zyte-rema-scraper.py")
+IMPORTER = os.path.join(SCRIPTS_DIR, "import_to_supabase.py")
+IMPORT_INPUT = "import-input.jsonl"
+
+# Mode -> (command, output file glob relative to the work dir, None: rows in the mock's product table);
+# delta needs a full run first
+MODES = {
+    'test': ([REMA_SCRAPER, '--test', '--limit', '200'], 'data/rema_products_test.jsonl'),
+    'full': ([REMA_SCRAPER], 'data/rema_products_full.jsonl'),
+    'delta': ([REMA_SCRAPER, '--delta'], 'data/rema_products_delta.jsonl'),
+    'zyte': ([ZYTE_SCRAPER], 'scraped-data/rema-products-*.jsonl*'),
+    'import-api': ([IMPORTER, '--input', IMPORT_INPUT, '--mode', 'api'], None),
+    'import-rest': ([IMPORTER, '--input', IMPORT_INPUT, '--mode', 'rest'], None)
+}
+DEFAULT_MODES = ['test', 'full', 'delta', 'zyte']
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark the REMA scrapers against a local mock API')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=DEFAULT_MODES,
+                        help=f'Scraper modes to run, in order (default: {" ".join(DEFAULT_MODES)})')
+    parser.add_argument('--data', nargs='+', default=[os.path.join(SCRIPTS_DIR, DEFAULT_DATA)],
+                        help='JSONL files or globs with recorded products to replay')
+    parser.add_argument('--products', type=int, help='Only replay the first N recorded products')
+    parser.add_argument('--latency', type=float, default=20.0, help='Mock REMA latency per request in ms (default: 20)')
+    parser.add_argument('--jitter', type=float, default=10.0, help='Extra random latency 0..N ms (default: 10)')
+    parser.add_argument('--zyte-latency', type=float, default=200.0, help='Mock Zyte latency per request in ms (default: 200)')
+    parser.add_argument('--import-latency', type=float, default=20.0,
+                        help='Mock import route latency per product in ms (default: 20)')
+    parser.add_argument('--rest-latency', type=float, default=50.0,
+                        help='Mock PostgREST latency per request in ms (default: 50)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 502/520')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests rejected with 429')
+    parser.add_argument('--etag', action='store_true', help='Mock sends ETags so the response cache gets hits')
+    parser.add_argument('--change-rate', type=float, default=0.05,
+                        help='Fraction of products whose price changes before a delta run (default: 0.05)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the mock server (default: 1)')
+    parser.add_argument('--scraper-args', default='', help='Extra arguments appended to every rema_scraper.py run')
+    parser.add_argument('--timeout', type=float, default=1800, help='Max seconds per mode (default: 1800)')
+    parser.add_argument('--workdir', help='Directory for scraper outputs and logs (default: temporary, removed)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    return parser.parse_args()
+
+def count_products(workdir: str, pattern: str) -> int:
+    """Products in the newest output file matching the mode's glob"""
+    paths = sorted(glob.glob(os.path.join(workdir, pattern)), key=os.path.getmtime)
+    if not paths:
+        return 0
+    with open_jsonl(paths[-1]) as f:
+        return sum(1 for line in f if line.strip())
+
+def write_import_input(server: MockRemaServer, workdir: str):
+    """The mock's current products as a scraper output file for the import modes.
+
+    Rewritten on every call so a reused --workdir never benchmarks an older
+    product set.
+    """
+    path = os.path.join(workdir, IMPORT_INPUT)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in server.export_records():
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+def run_mode(mode: str, server: MockRemaServer, workdir: str, args) -> dict:
+    """Run one scraper mode against the mock server and collect its numbers"""
+    command, output_pattern = MODES[mode]
+    command = [sys.executable] + command
+    if command[1] == REMA_SCRAPER and args.scraper_args:
+        command += args.scraper_args.split()
+
+    env = dict(os.environ)
+    env['REMA_API_URL'] = server.url
+    env['ZYTE_API_URL'] = f"{server.url}/v1/extract"
+    env['ZYTE_API_KEY'] = 'mock'
+    env['IMPORT_API_URL'] = f"{server.url}{IMPORT_ROUTE}"
+    env['SUPABASE_URL'] = server.url
+    env['SUPABASE_SERVICE_ROLE_KEY'] = 'mock'
+    env['PYTHONUNBUFFERED'] = '1'
+
+    changed = server.mutate(args.change_rate) if mode == 'delta' else 0
+    if output_pattern is None:
+        write_import_input(server, workdir)
+        server.reset_tables()
+    server.log.reset()
+    log_file = os.path.join(workdir, f"{mode}.log")
+
+    print(f"▶️  {mode}: {' '.join(os.path.basename(part) for part in command[1:])}")
+    started = time.perf_counter()
+    with open(log_file, 'w', encoding='utf-8') as log:
+        try:
+            exit_code = subprocess.run(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                       timeout=args.timeout).returncode
+        except subprocess.TimeoutExpired:
+            exit_code = 'timeout'
+    wall = time.perf_counter() - started
+
+    requests = server.log.summary()
+    if output_pattern is None:
+        products = len(server.table_rows(PRODUCTS_TABLE))
+    else:
+        products = count_products(workdir, output_pattern)
+    return {
+        'mode': mode,
+        'exit_code': exit_code,
+        'wall_seconds': round(wall, 2),
+        'products': products,
+        'products_per_second': round(products / wall, 1) if wall else 0.0,
+        'requests': requests['requests'],
+        'requests_per_second': round(requests['requests'] / wall, 1) if wall else 0.0,
+        'p50_ms': requests['p50_ms'],
+        'p99_ms': requests['p99_ms'],
+        'bytes': requests['bytes'],
+        'changed_before_run': changed,
+        'routes': requests['routes'],
+        'log': log_file
+    }
+
+def print_results(results: list):
+    print(f"\n{'mode':<11} {'wall s':>8} {'products':>9} {'prod/s':>8} {'requests':>9} {'req/s':>7} "
+          f"{'p50 ms':>7} {'p99 ms':>7}  exit")
+    for result in results:
+        print(f"{result['mode']:<11} {result['wall_seconds']:>8} {result['products']:>9} "
+              f"{result['products_per_second']:>8} {result['requests']:>9} {result['requests_per_second']:>7} "
+              f"{result['p50_ms']:>7} {result['p99_ms']:>7}  {result['exit_code']}")
+
+def main():
+    args = parse_arguments()
+    records = load_records(args.data)
+    if args.products:
+        records = records[:args.products]
+    if not records:
+        print(f"❌ No recorded products found in {args.data}")
+        return 1
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rema-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    server = MockRemaServer(records, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                            zyte_latency=args.zyte_latency / 1000, error_rate=args.error_rate,
+                            throttle_rate=args.throttle_rate, etag=args.etag, seed=args.seed,
+                            import_latency=args.import_latency / 1000, rest_latency=args.rest_latency / 1000).start()
+    print(f"🧪 Mock REMA API with {len(records)} products on {server.url} (work dir: {workdir})")
+
+    modes = list(args.modes)
+    if 'delta' in modes and 'full' not in modes[:modes.index('delta')]:
+        print("ℹ️  delta needs a seeded snapshot, running full first")
+        modes.insert(modes.index('delta'), 'full')
+
+    results = []
+    try:
+        for mode in modes:
+            results.append(run_mode(mode, server, workdir, args))
+    finally:
+        server.stop()
+
+    print_results(results)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'workdir')},
+        'mock_products': len(records),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📁 Results saved to: {args.output}")
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if all(result['exit_code'] == 0 for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Transform micro-benchmark
+Times the Zyte scraper's generic transform_product against the compiled
+ProductTransformer fast path on recorded products, in the shop API layout the
+scraper sees, the raw REMA layout and the nested {'product': ...} layout, and
+checks both paths produce the same records.
+
+Usage:
+    python benchmark_transform.py
+    python benchmark_transform.py --records 20000 --repeat 5 --output transform-bench.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from mock_rema_server import DEFAULT_DATA, MockRemaServer, load_records
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_scraper():
+    """Import zyte-rema-scraper.py (hyphenated file name) without needing a real API key"""
+    os.environ.setdefault('ZYTE_API_KEY', 'benchmark')
+    spec = importlib.util.spec_from_file_location('zyte_rema_scraper', os.path.join(SCRIPTS_DIR, 'zyte-rema-scraper.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark generic vs compiled product transforms')
+    parser.add_argument('--data', nargs='+', default=[os.path.join(SCRIPTS_DIR, DEFAULT_DATA)],
+                        help='JSONL files or globs with recorded products')
+    parser.add_argument('--records', type=int, default=10000, help='Records per layout (recycled if fewer recorded)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes per path; the best one counts (default: 3)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    return parser.parse_args()
+
+def build_layouts(records: list, count: int) -> dict:
+    """The same products in each layout the transform has to handle"""
+    mock = MockRemaServer(records)
+    mock.httpd.server_close()
+    shop = [mock.shop_product(product, dept_id) for product, dept_id in mock.products]
+    raw = [product for product, _ in mock.products]
+
+    def sized(items):
+        return [items[index % len(items)] for index in range(count)]
+
+    return {
+        'shop': sized(shop),
+        'raw': sized(raw),
+        'nested': sized([{'product': product} for product in shop])
+    }
+
+def best_time(function, items: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def compare(generic: list, compiled: list) -> int:
+    """Records whose output differs between the paths (last_updated ignored)"""
+    mismatches = 0
+    for left, right in zip(generic, compiled):
+        if left is None or right is None:
+            mismatches += left is not right
+            continue
+        if {**left, 'last_updated': None} != {**right, 'last_updated': None}:
+            mismatches += 1
+    return mismatches
+
+def main():
+    args = parse_arguments()
+    records = load_records(args.data)
+    if not records:
+        print(f"❌ No recorded products found in {args.data}")
+        return 1
+
+    scraper = load_scraper()
+    scraper.log = lambda message: None  # Silence per-record transform error lines while timing
+    layouts = build_layouts(records, args.records)
+    print(f"🧪 {len(records)} recorded products, {args.records} records per layout, best of {args.repeat}")
+
+    results = []
+    for name, items in layouts.items():
+        stamp = datetime.now().isoformat()
+        transformer = scraper.ProductTransformer()
+        generic_seconds = best_time(scraper.transform_product, items, args.repeat)
+        compiled_seconds = best_time(lambda item: transformer(item, stamp), items, args.repeat)
+        mismatches = compare([scraper.transform_product(item) for item in items],
+                             [transformer(item, stamp) for item in items])
+        results.append({
+            'layout': name,
+            'records': len(items),
+            'generic_us': round(generic_seconds / len(items) * 1e6, 3),
+            'compiled_us': round(compiled_seconds / len(items) * 1e6, 3),
+            'speedup': round(generic_seconds / compiled_seconds, 2) if compiled_seconds else 0.0,
+            'mismatches': mismatches,
+            'layouts_compiled': transformer.summary()['layouts']
+        })
+
+    print(f"\n{'layout':<8} {'generic µs':>11} {'compiled µs':>12} {'speedup':>8} {'mismatches':>11}")
+    for result in results:
+        print(f"{result['layout']:<8} {result['generic_us']:>11} {result['compiled_us']:>12} "
+              f"{result['speedup']:>7}x {result['mismatches']:>11}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'results': results}, f, indent=2)
+        print(f"📁 Results saved to: {args.output}")
+
+    return 0 if all(result['mismatches'] == 0 for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+HTTP response cache
+On-disk cache of GET response bodies with their ETag / Last-Modified
+validators, used to send conditional requests and serve 304s locally.
+Size-bounded with least-recently-used eviction.
+"""
+
+import sqlite3
+import time
+
+class ResponseCache:
+    """SQLite-backed store of validated response bodies keyed by URL"""
+
+    def __init__(self, path: str, max_bytes: int = 500 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " body BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self.pending_writes = 0
+        if self.total_bytes > self.max_bytes:
+            # The size limit may have been lowered since the last run
+            self.evict()
+            self.conn.commit()
+
+    def conditional_headers(self, url: str) -> dict:
+        """If-None-Match / If-Modified-Since headers for a cached URL (empty if not cached, counted as a miss)"""
+        self.lookups += 1
+        row = self.conn.execute(
+            "SELECT etag, last_modified FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if not row:
+            self.misses += 1
+            return {}
+        headers = {}
+        if row[0]:
+            headers['If-None-Match'] = row[0]
+        if row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def hit(self, url: str):
+        """Body for a 304 response, or None if the entry vanished (evicted meanwhile)"""
+        row = self.conn.execute("SELECT body FROM responses WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return None
+        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        self._maybe_commit()
+        self.hits += 1
+        self.bytes_saved += len(row[0])
+        return row[0]
+
+    def store(self, url: str, headers, body: bytes):
+        """Remember a 200 response if the server gave us a validator to revalidate with"""
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if not etag and not last_modified:
+            return
+
+        previous = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (url, etag, last_modified, body, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, body, len(body), time.time())
+        )
+        self.total_bytes += len(body) - (previous[0] if previous else 0)
+        self.stores += 1
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        self._maybe_commit()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes"""
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall()
+        doomed = []
+        for url, size in rows:
+            if self.total_bytes <= target:
+                break
+            doomed.append((url,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM responses WHERE url = ?", doomed)
+        self.evictions += len(doomed)
+
+    def _maybe_commit(self):
+        # Batch commits; losing the last few entries on a crash only costs a refetch
+        self.pending_writes += 1
+        if self.pending_writes >= 200:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def summary(self) -> dict:
+        # lookups - hits - misses: cached URLs whose content changed (answered 200, not 304)
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'bytes_saved': self.bytes_saved,
+            'cached_bytes': self.total_bytes
+        }
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
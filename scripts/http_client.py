@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+HTTP client factory
+One place to build the long-lived HTTP clients used by the scrapers and the
+importer: HTTP/2 where available, explicit keep-alive pool limits and
+timeouts per phase, so thousands of requests share a few warm connections.
+"""
+
+import httpx
+
+# Timeouts per phase: listing pages are big, detail calls small, imports slow on the server side
+PHASE_TIMEOUTS = {
+    'list': httpx.Timeout(30.0, connect=10.0),
+    'detail': httpx.Timeout(20.0, connect=10.0),
+    'enrich': httpx.Timeout(20.0, connect=10.0),
+    'delta': httpx.Timeout(20.0, connect=10.0),
+    'import': httpx.Timeout(120.0, connect=10.0)
+}
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+def phase_timeout(phase: str) -> httpx.Timeout:
+    return PHASE_TIMEOUTS.get(phase, DEFAULT_TIMEOUT)
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install 'httpx[http2]')"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def create_async_client(max_connections: int = 20, max_keepalive: int = None, http2: bool = True,
+                        phase: str = None, headers: dict = None, **kwargs) -> httpx.AsyncClient:
+    """Build a shared AsyncClient; reuse it for a whole run rather than per request or batch"""
+    if http2 and not http2_available():
+        print("⚠️ h2 not installed, falling back to HTTP/1.1 (pip install 'httpx[http2]')")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive if max_keepalive is not None else max_connections,
+        keepalive_expiry=30.0
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=phase_timeout(phase) if phase else DEFAULT_TIMEOUT,
+        headers=headers,
+        **kwargs
+    )
+
+def create_session(pool_size: int = 10, headers: dict = None):
+    """Build a pooled requests.Session for the synchronous (threaded) scripts"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
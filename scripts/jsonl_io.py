@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+JSONL I/O helpers
+Streaming readers and writers so scrapers and the importer never hold a
+full catalogue in memory. Paths ending in .gz or .zst are (de)compressed
+transparently; zstd needs the optional `zstandard` package, and records
+are parsed with `orjson` when it is installed.
+"""
+
+import asyncio
+import gzip
+import io
+import json
+import os
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+def compression_for(path: str):
+    """'gzip', 'zstd' or None, from the file extension"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+def with_compression(path: str, compression: str = None) -> str:
+    """Add the suffix for `compression` to path (falling back to gzip if zstandard is missing)"""
+    if not compression or compression == 'none':
+        return path
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression: {compression} (use gzip or zstd)")
+    if compression == 'zstd' and zstandard is None:
+        print("⚠️ zstandard not installed, writing gzip instead (pip install zstandard)")
+        compression = 'gzip'
+    return path + COMPRESSION_SUFFIXES[compression]
+
+def open_jsonl(path: str, mode: str = 'r'):
+    """Open a JSONL file as text for reading, writing or appending, compressed by extension"""
+    compression = compression_for(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError(f"Reading or writing {path} needs zstandard (pip install zstandard)")
+        raw = open(path, mode + 'b')
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def open_jsonl_binary(path: str):
+    """Open a JSONL file for reading raw byte lines, decompressed by extension"""
+    compression = compression_for(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} needs zstandard (pip install zstandard)")
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.BufferedReader(stream)
+    return open(path, 'rb')
+
+def parse_json(line):
+    """Parse one JSON document (bytes or str) with orjson if available"""
+    return orjson.loads(line) if orjson else json.loads(line)
+
+# A compressed file cut off mid-stream (crashed or still running writer) ends reading instead of failing it
+TRUNCATED_STREAM_ERRORS = (EOFError, zlib.error, gzip.BadGzipFile) + ((zstandard.ZstdError,) if zstandard else ())
+
+def load_jsonl(path: str, on_error=None):
+    """Yield records from a plain, .gz or .zst JSONL file one at a time.
+
+    Blank lines are skipped; unparsable lines and a truncated compressed
+    stream are reported to on_error(line_number, error) (if given) and
+    skipped, so a partial file yields every complete record it holds.
+    """
+    line_num = 0
+    with open_jsonl_binary(path) as f:
+        try:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield parse_json(line)
+                except ValueError as e:
+                    if on_error:
+                        on_error(line_num, e)
+        except TRUNCATED_STREAM_ERRORS as e:
+            if on_error:
+                on_error(line_num + 1, e)
+
+class AsyncJsonlWriter:
+    """Append records to a JSONL file one line at a time with periodic flush.
+
+    Every record is written as a complete line, so a file cut short by a
+    crash is still valid JSONL up to the last flush.
+    """
+
+    def __init__(self, path: str, mode: str = 'w', flush_every: int = 100, flush_interval: float = 5.0,
+                 on_flush=None):
+        self.path = path
+        self.mode = mode
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.file = None
+        self.count = 0
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    async def __aenter__(self):
+        self.file = open(self.path, self.mode, encoding='utf-8')
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+        self.unflushed += 1
+
+        if self.unflushed >= self.flush_every or time.monotonic() - self.flushed_at >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        """Push buffered lines to disk without blocking the event loop on fsync"""
+        self.file.flush()
+        await asyncio.to_thread(os.fsync, self.file.fileno())
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+        if self.on_flush:
+            # Called with the byte offset that is now durable on disk
+            self.on_flush(self.file.tell())
+
+    async def close(self):
+        if self.file and not self.file.closed:
+            await self.flush()
+            self.file.close()
+
+class JsonlWriter:
+    """Synchronous JSONL writer for threaded scripts, with periodic flush.
+
+    Compressed outputs are flushed at block boundaries, so everything up to
+    the last flush can be read back while the file is still being written.
+    """
+
+    def __init__(self, path: str, mode: str = 'w', flush_every: int = 100, flush_interval: float = 5.0):
+        self.path = path
+        self.mode = mode
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.file = None
+        self.count = 0
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    def open(self):
+        self.file = open_jsonl(self.path, self.mode)
+        return self
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+        self.unflushed += 1
+
+        if self.unflushed >= self.flush_every or time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if compression_for(self.path) is None:
+            os.fsync(self.file.fileno())
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        if self.file and not self.file.closed:
+            self.flush()
+            self.file.close()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+JSONL pipeline
+Streams scraped products once through configurable stages instead of
+rewriting the whole catalogue between filter_food_products.py,
+clean-json-duplicates.py, create_test_sample.py / extract-batches-26-30.py
+and import_to_supabase.py. Each record is parsed once, passed through the
+stages in the order given and, at the end, written to --output and/or
+handed to the importer; per-stage records in/out and throughput are printed.
+
+Stages:
+    filter     drop non-food products (filter_food_products keywords) and records without a name
+    dedupe     keep the first record per --dedupe-key (name, as clean-json-duplicates.py, id or content hash)
+    transform  --renumber-ids START and/or --stamp-hashes
+    slice      skip --skip records, then pass --take records and stop reading
+    import     diff and send to Supabase like import_to_supabase.py (same options), must be last
+
+Usage:
+    python jsonl_pipeline.py --input data/rema_products_batch_1.jsonl --output data/rema_products_clean.jsonl
+    python jsonl_pipeline.py --input data/rema_products_batch_1.jsonl --stages filter dedupe slice \\
+        --take 200 --output data/rema_products_test_200.jsonl
+    python jsonl_pipeline.py --input data/rema_products_full.jsonl.gz --stages filter dedupe import --mode rest
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator
+
+from filter_food_products import non_food_keyword
+from import_to_supabase import add_import_arguments, default_dead_letter, import_products, save_metrics
+from jsonl_io import JsonlWriter, load_jsonl
+from product_hash import record_content_hash, stamp_hashes
+from run_metrics import RunMetrics
+
+STAGE_NAMES = ('filter', 'dedupe', 'transform', 'slice', 'import')
+DEFAULT_STAGES = ['filter', 'dedupe']
+SAMPLE_SIZE = 10  # Dropped records listed per stage, like the old scripts did
+
+# One registry for the stages and, passed to import_products, the importer's phases
+METRICS = RunMetrics("jsonl_pipeline")
+
+class Stage:
+    """One pipeline step: process() returns the record to pass on, or None to drop it"""
+
+    name = 'stage'
+
+    def __init__(self):
+        self.records_in = 0
+        self.records_out = 0
+        self.seconds = 0.0
+        self.exhausted = False  # Set once no further record can pass (slice reached --take)
+        self.dropped = []
+
+    def process(self, record: Dict[str, Any]):
+        return record
+
+    def drop(self, record: Dict[str, Any], reason: str):
+        if len(self.dropped) < SAMPLE_SIZE:
+            self.dropped.append(f"{record.get('name', 'Unknown')} ({reason})")
+        return None
+
+class FilterStage(Stage):
+    name = 'filter'
+
+    def process(self, record):
+        name = record.get('name')
+        if not name:
+            return self.drop(record, 'no name')
+        keyword = non_food_keyword(name)
+        if keyword is not None:
+            return self.drop(record, f"non-food: {keyword}")
+        return record
+
+class DedupeStage(Stage):
+    name = 'dedupe'
+
+    KEYS = {
+        'name': lambda record: (record.get('name') or '').lower().strip(),
+        'id': lambda record: str(record.get('id') or ''),
+        'content': record_content_hash
+    }
+
+    def __init__(self, key: str = 'name'):
+        super().__init__()
+        self.key = self.KEYS[key]
+        self.seen = set()
+
+    def process(self, record):
+        key = self.key(record)
+        if not key or key in self.seen:
+            return self.drop(record, 'duplicate')
+        self.seen.add(key)
+        return record
+
+class TransformStage(Stage):
+    name = 'transform'
+
+    def __init__(self, renumber_from: int = None, stamp: bool = False):
+        super().__init__()
+        self.next_id = renumber_from
+        self.stamp = stamp
+
+    def process(self, record):
+        if self.next_id is not None:
+            record['id'] = self.next_id
+            self.next_id += 1
+        if self.stamp:
+            stamp_hashes(record)
+        return record
+
+class SliceStage(Stage):
+    name = 'slice'
+
+    def __init__(self, skip: int = 0, take: int = None):
+        super().__init__()
+        self.skip = skip
+        self.take = take
+        self.taken = 0
+
+    def process(self, record):
+        if self.skip:
+            self.skip -= 1
+            return None
+        if self.take is not None and self.taken >= self.take:
+            self.exhausted = True
+            return None
+        self.taken += 1
+        if self.take is not None and self.taken >= self.take:
+            self.exhausted = True
+        return record
+
+class Pipeline:
+    """Reads records once and pulls each through every stage in order"""
+
+    def __init__(self, stages: list):
+        self.stages = stages
+        self.read = Stage()
+        self.read.name = 'read'
+        self.parse_errors = 0
+
+    def source(self, paths: list) -> Iterator[Dict[str, Any]]:
+        """Records from every input file in turn, with read + parse time counted to the read stage"""
+
+        def on_error(line_num, error):
+            self.parse_errors += 1
+            print(f"⚠️ Error parsing line {line_num}: {error}")
+
+        end = object()
+        for path in paths:
+            print(f"📖 Streaming products from {path}...")
+            records = load_jsonl(path, on_error=on_error)
+            while True:
+                started = time.perf_counter()
+                record = next(records, end)
+                self.read.seconds += time.perf_counter() - started
+                if record is end:
+                    break
+                self.read.records_in += 1
+                if not isinstance(record, dict):
+                    on_error(self.read.records_in, f"not a JSON object: {str(record)[:40]}")
+                    continue
+                self.read.records_out += 1
+                yield record
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield the records that pass every stage; stops reading once a stage is exhausted"""
+        perf_counter = time.perf_counter
+        for record in records:
+            exhausted = False
+            for stage in self.stages:
+                stage.records_in += 1
+                started = perf_counter()
+                record = stage.process(record)
+                stage.seconds += perf_counter() - started
+                exhausted = exhausted or stage.exhausted
+                if record is None:
+                    break
+                stage.records_out += 1
+            if record is not None:
+                yield record
+            if exhausted:
+                return
+
+    def report(self, wall: float):
+        """Per-stage table, sample of dropped records, and the stage numbers in METRICS (stage_<name> phases)"""
+        print(f"\n{'stage':<10} {'in':>8} {'out':>8} {'seconds':>8} {'records/s':>10}")
+        for stage in [self.read] + self.stages:
+            rate = f"{stage.records_in / stage.seconds:.0f}" if stage.seconds else '-'
+            print(f"{stage.name:<10} {stage.records_in:>8} {stage.records_out:>8} {stage.seconds:>8.3f} {rate:>10}")
+            phase = f"stage_{stage.name}"  # The importer has its own transform phase
+            METRICS.add_time(phase, stage.seconds)
+            METRICS.count(phase, 'records_in', stage.records_in)
+            METRICS.count(phase, 'records', stage.records_out)
+        print(f"⏱️  {self.read.records_in} records in {wall:.2f}s wall"
+              + (f", {self.parse_errors} unparsable lines" if self.parse_errors else ""))
+        for stage in self.stages:
+            if stage.dropped:
+                print(f"\n🗑️  Dropped by {stage.name} (first {len(stage.dropped)}):")
+                for line in stage.dropped:
+                    print(f"  {line}")
+
+    def summary(self) -> Dict[str, Any]:
+        return {stage.name: {'in': stage.records_in, 'out': stage.records_out, 'seconds': round(stage.seconds, 3)}
+                for stage in [self.read] + self.stages}
+
+def build_stages(args) -> list:
+    stages = []
+    for name in args.stages:
+        if name == 'filter':
+            stages.append(FilterStage())
+        elif name == 'dedupe':
+            stages.append(DedupeStage(args.dedupe_key))
+        elif name == 'transform':
+            stages.append(TransformStage(args.renumber_ids, args.stamp_hashes))
+        elif name == 'slice':
+            stages.append(SliceStage(args.skip, args.take))
+    return stages
+
+def partial_path(path: str) -> str:
+    """Hidden temp name next to path that keeps its compression suffix"""
+    return os.path.join(os.path.dirname(path), f".partial-{os.path.basename(path)}")
+
+def write_through(records: Iterable[Dict[str, Any]], writer: JsonlWriter) -> Iterator[Dict[str, Any]]:
+    """Write each record as it passes on to the next consumer"""
+    for record in records:
+        writer.write(record)
+        yield record
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Stream REMA products once through filter, dedupe, transform, '
+                                                 'slice and import stages')
+    parser.add_argument('--input', nargs='+', required=True, help='Input JSONL files (.gz/.zst too), read in order')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_NAMES, default=DEFAULT_STAGES,
+                        help=f'Stages in the order records pass them (default: {" ".join(DEFAULT_STAGES)})')
+    parser.add_argument('--output', help='Write the records that pass every stage to this JSONL file')
+    parser.add_argument('--dedupe-key', choices=list(DedupeStage.KEYS), default='name',
+                        help='dedupe: what makes two records the same (default: name, case-insensitive)')
+    parser.add_argument('--renumber-ids', type=int, metavar='START', help='transform: number ids from START')
+    parser.add_argument('--stamp-hashes', action='store_true', help='transform: store price_hash and content_hash')
+    parser.add_argument('--skip', type=int, default=0, help='slice: records to skip (default: 0)')
+    parser.add_argument('--take', type=int, help='slice: records to pass after the skipped ones (default: all)')
+    add_import_arguments(parser)
+    args = parser.parse_args()
+
+    if 'import' in args.stages and args.stages.index('import') != len(args.stages) - 1:
+        parser.error("import must be the last stage")
+    if 'import' not in args.stages and not args.output:
+        parser.error("nothing to do with the records: give --output and/or end --stages with import")
+    if 'transform' in args.stages and args.renumber_ids is None and not args.stamp_hashes:
+        parser.error("transform needs --renumber-ids and/or --stamp-hashes")
+    if args.output and os.path.abspath(args.output) in {os.path.abspath(path) for path in args.input}:
+        parser.error("--output must not be one of the inputs")
+    return args
+
+async def main():
+    """Main pipeline function"""
+    args = parse_arguments()
+    missing = [path for path in args.input if not os.path.exists(path)]
+    if missing:
+        print(f"❌ Input file not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    print(f"🚀 Pipeline: read → {' → '.join(args.stages)}" + (f" → {args.output}" if args.output else ""))
+    print("=" * 60)
+
+    pipeline = Pipeline(build_stages(args))
+    records = pipeline.run(pipeline.source(args.input))
+    writer = JsonlWriter(partial_path(args.output), flush_every=1000).open() if args.output else None
+    if writer:
+        records = write_through(records, writer)
+
+    started = time.perf_counter()
+    summary = {}
+    completed = False
+    try:
+        if 'import' in args.stages:
+            args.input = args.input[0]  # Dead letters default to <first input>.failed.jsonl
+            args.dead_letter = args.dead_letter or default_dead_letter(args.input)
+            summary = await import_products(records, args, metrics=METRICS)
+        else:
+            for _ in records:
+                pass
+        completed = True
+    except Exception as e:
+        print(f"❌ Pipeline failed: {e}")
+        sys.exit(1)
+    finally:
+        if writer:
+            writer.close()
+            if not completed and os.path.exists(writer.path):
+                os.remove(writer.path)  # Never leave a half-written .partial-<output> behind
+    if writer:
+        os.replace(writer.path, args.output)
+        print(f"💾 Wrote {writer.count} products to: {args.output}")
+
+    pipeline.report(time.perf_counter() - started)
+    summary['stages'] = pipeline.summary()
+    save_metrics(args, summary, METRICS)
+
+    if summary.get('failed'):
+        print(f"\n⚠️ Pipeline finished with {summary['failed']} failed products")
+        sys.exit(2)
+    print("\n🎉 Pipeline completed successfully!")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Mock REMA API server
+Local stand-in for the REMA product API and Zyte's /v1/extract that replays
+recorded products (data/*.jsonl), with configurable latency and error rates,
+so the scrapers can be run and benchmarked offline. It also plays the
+importer's targets: the Next.js import-rema-products route (with per-product
+overhead) and PostgREST upserts/inserts under /rest/v1/<table>, both writing
+to in-memory tables.
+
+Usage:
+    python mock_rema_server.py --port 8765 --latency 20 --error-rate 0.01
+    REMA_API_URL=http://127.0.0.1:8765 python rema_scraper.py --test
+    ZYTE_API_URL=http://127.0.0.1:8765/v1/extract ZYTE_API_KEY=mock python zyte-rema-scraper.py
+    SUPABASE_URL=http://127.0.0.1:8765 python import_to_supabase.py --input data/rema_products.jsonl --mode rest
+"""
+
+import argparse
+import base64
+import glob
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from jsonl_io import load_jsonl
+from supabase_bulk import CONFLICT_COLUMN, PRODUCTS_TABLE, to_product_row
+
+DEFAULT_DATA = "data/*.jsonl"
+DEFAULT_PORT = 8765
+SHOP_URL = "https://shop.rema1000.dk"
+INITIAL_MODIFIED_AT = "2025-01-01T00:00:00+00:00"
+OFFERS_CATEGORY = "tilbud"  # Shop category overlapping the departments (campaign products)
+IMPORT_ROUTE = "/api/admin/dagligvarer/import-rema-products"
+
+# Departments given to recorded products that were saved without one
+MOCK_DEPARTMENTS = [
+    (10, "Brød & Bavinchi"),
+    (20, "Frugt & grønt"),
+    (30, "Kød & fisk"),
+    (40, "Køl"),
+    (50, "Frost"),
+    (60, "Mejeri"),
+    (70, "Ost m.v."),
+    (80, "Kolonial"),
+    (90, "Drikkevarer"),
+    (100, "Husholdning")
+]
+
+def load_records(patterns: list) -> list:
+    """Load recorded products from JSONL files, first record per id wins, sorted by id"""
+    records = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            for record in load_jsonl(path):
+                if isinstance(record, dict) and 'id' in record:
+                    records.setdefault(record['id'], record)
+    return [records[product_id] for product_id in sorted(records)]
+
+class RequestLog:
+    """Thread-safe per-route request counts, bytes, statuses and handling times"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+            self.started_at = time.monotonic()
+
+    def record(self, route: str, status: int, size: int, seconds: float):
+        with self.lock:
+            entry = self.routes.setdefault(route, {'durations': [], 'bytes': 0, 'statuses': {}})
+            entry['durations'].append(seconds)
+            entry['bytes'] += size
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+
+    @staticmethod
+    def percentile(ordered: list, pct: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def summary(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at
+            routes = {}
+            everything = []
+            for route, entry in sorted(self.routes.items()):
+                ordered = sorted(entry['durations'])
+                everything.extend(ordered)
+                routes[route] = {
+                    'requests': len(ordered),
+                    'bytes': entry['bytes'],
+                    'statuses': {str(status): count for status, count in sorted(entry['statuses'].items())},
+                    'p50_ms': round(self.percentile(ordered, 50) * 1000, 1),
+                    'p99_ms': round(self.percentile(ordered, 99) * 1000, 1)
+                }
+            everything.sort()
+            return {
+                'requests': len(everything),
+                'bytes': sum(entry['bytes'] for entry in self.routes.values()),
+                'elapsed_seconds': round(elapsed, 3),
+                'p50_ms': round(self.percentile(everything, 50) * 1000, 1),
+                'p99_ms': round(self.percentile(everything, 99) * 1000, 1),
+                'routes': routes
+            }
+
+class MockRemaServer:
+    """Replay recorded products as the REMA API, a shop-style API and Zyte /v1/extract"""
+
+    def __init__(self, records: list, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, zyte_latency: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, etag: bool = False, seed: int = None,
+                 import_latency: float = 0.0, rest_latency: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.zyte_latency = zyte_latency
+        self.import_latency = import_latency
+        self.rest_latency = rest_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.etag = etag
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.log = RequestLog()
+        self.tables = {}
+
+        self.products = []
+        self.by_id = {}
+        self.departments = {dept_id: {'id': dept_id, 'name': name, 'products_last_modified_at': INITIAL_MODIFIED_AT}
+                            for dept_id, name in MOCK_DEPARTMENTS}
+        for index, record in enumerate(records):
+            product = dict(record)
+            department = product.pop('department', None)
+            if isinstance(department, dict) and 'id' in department:
+                self.departments.setdefault(department['id'], {
+                    'id': department['id'],
+                    'name': department.get('name', ''),
+                    'products_last_modified_at': INITIAL_MODIFIED_AT
+                })
+                dept_id = department['id']
+            else:
+                dept_id = MOCK_DEPARTMENTS[index % len(MOCK_DEPARTMENTS)][0]
+            self.products.append((product, dept_id))
+            self.by_id[str(product['id'])] = (product, dept_id)
+
+        self.httpd = ThreadingHTTPServer((host, port), MockRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a background thread (for in-process benchmarks)"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-rema", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def mutate(self, fraction: float) -> int:
+        """Change the price of a random fraction of products and bump their departments' watermarks"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            changed = self.random.sample(range(len(self.products)), int(len(self.products) * fraction))
+            for index in changed:
+                product, dept_id = self.products[index]
+                prices = [dict(price) for price in product.get('prices') or [{'price': 10.0}]]
+                prices[0]['price'] = round((prices[0].get('price') or 10.0) + 1.0, 2)
+                product['prices'] = prices
+                self.departments[dept_id]['products_last_modified_at'] = now
+        return len(changed)
+
+    def delay(self, zyte: bool = False) -> float:
+        base = self.zyte_latency if zyte else self.latency
+        return base + self.random.uniform(0, self.jitter) if base or self.jitter else 0.0
+
+    def export_records(self) -> list:
+        """The replayed products with their departments, as the scraper writes them (importer input)"""
+        with self.lock:
+            return [{**product, 'department': {'id': dept_id, 'name': self.departments[dept_id]['name']}}
+                    for product, dept_id in self.products]
+
+    def injected_failure(self, zyte: bool = False):
+        """Status code to fail this request with, or None"""
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 520 if zyte else 502
+        return None
+
+    # --- REMA API (api.digital.rema1000.dk) ---
+
+    def product_listing(self, query: dict) -> dict:
+        per_page = int(query.get('per_page', ['100'])[0])
+        page = int(query.get('page', ['1'])[0])
+        total = len(self.products)
+        start = (page - 1) * per_page
+        with self.lock:
+            data = [dict(product) for product, _ in self.products[start:start + per_page]]
+        return {
+            'data': data,
+            'meta': {'pagination': {
+                'current_page': page,
+                'last_page': max(1, -(-total // per_page)),
+                'per_page': per_page,
+                'total': total
+            }}
+        }
+
+    def product_detail(self, product_id: str):
+        with self.lock:
+            entry = self.by_id.get(product_id)
+            if not entry:
+                return None
+            product, dept_id = entry
+            return {'data': {**product, 'department': dict(self.departments[dept_id])}}
+
+    # --- Shop-style API reached through Zyte (shop.rema1000.dk) ---
+
+    def shop_categories(self) -> dict:
+        used = sorted({dept_id for _, dept_id in self.products})
+        categories = [{'id': dept_id, 'name': self.departments[dept_id]['name']} for dept_id in used]
+        return {'categories': categories + [{'id': OFFERS_CATEGORY, 'name': 'Tilbud'}]}
+
+    @staticmethod
+    def on_offer(product: dict) -> bool:
+        return any(price.get('is_campaign') or price.get('is_advertised') for price in product.get('prices') or [])
+
+    def shop_products(self, query: dict) -> dict:
+        limit = int(query.get('limit', ['50'])[0])
+        page = int(query.get('page', ['1'])[0])
+        category = query.get('category', [None])[0]
+        with self.lock:
+            if category == OFFERS_CATEGORY:
+                selected = [(product, dept_id) for product, dept_id in self.products if self.on_offer(product)]
+            else:
+                selected = [(product, dept_id) for product, dept_id in self.products
+                            if category is None or str(dept_id) == category]
+            start = (page - 1) * limit
+            items = [self.shop_product(product, dept_id) for product, dept_id in selected[start:start + limit]]
+        return {'products': items, 'page': page, 'total': len(selected)}
+
+    def shop_product(self, product: dict, dept_id: int) -> dict:
+        prices = product.get('prices') or []
+        price = prices[0].get('price') if prices else None
+        images = product.get('images') or []
+        return {
+            'id': product['id'],
+            'name': product.get('name'),
+            'price': price,
+            'originalPrice': prices[1].get('price') if len(prices) > 1 else None,
+            'category': self.departments[dept_id]['name'],
+            'description': product.get('description'),
+            'brand': (product.get('underline') or '').split(' / ')[-1] or None,
+            'imageUrl': images[0].get('medium') if images else None,
+            'inStock': True
+        }
+
+    def route(self, path: str, query: dict):
+        """(route name, status, payload) for a GET on the REMA or shop API"""
+        if path == '/api/v3/products':
+            return 'list', 200, self.product_listing(query)
+        if path.startswith('/api/v3/products/'):
+            detail = self.product_detail(path.rsplit('/', 1)[1])
+            return ('detail', 200, detail) if detail else ('detail', 404, {'message': 'Not found'})
+        if path == '/api/categories':
+            return 'shop', 200, self.shop_categories()
+        if path == '/api/products':
+            return 'shop', 200, self.shop_products(query)
+        if path.startswith('/rest/v1/'):
+            return 'rest', 200, self.rest_select(path[len('/rest/v1/'):], query)
+        return 'other', 404, {'message': 'Not found'}
+
+    def zyte_extract(self, payload: dict) -> dict:
+        """Answer a Zyte extract request: network capture of the shop page or a proxied GET"""
+        if payload.get('networkCapture'):
+            captures = []
+            for url in (f"{SHOP_URL}/api/categories", f"{SHOP_URL}/api/products?page=1&limit=50"):
+                parsed = urlparse(url)
+                _, _, body = self.route(parsed.path, parse_qs(parsed.query))
+                captures.append({'url': url, 'httpResponseBody': encode_body(body)})
+            return {'url': payload.get('url'), 'statusCode': 200, 'networkCapture': captures}
+
+        parsed = urlparse(payload.get('url', ''))
+        _, status, body = self.route(parsed.path, parse_qs(parsed.query))
+        return {'url': payload.get('url'), 'statusCode': status,
+                'httpResponseBody': encode_body(body) if status == 200 else base64.b64encode(b'Not found').decode()}
+
+    # --- Import targets (Next.js import route, Supabase PostgREST) ---
+
+    def table_rows(self, table: str) -> dict:
+        with self.lock:
+            return dict(self.tables.get(table, {}))
+
+    def reset_tables(self):
+        with self.lock:
+            self.tables = {}
+
+    def import_route(self, payload: dict):
+        """(status, response) for the import-rema-products route: one upsert per product, like the real route"""
+        products = payload.get('products') or []
+        time.sleep(self.import_latency * len(products))
+        rows = [to_product_row(product) for product in products]
+        with self.lock:
+            table = self.tables.setdefault(PRODUCTS_TABLE, {})
+            new = sum(1 for row in rows if row[CONFLICT_COLUMN] not in table)
+            for row in rows:
+                table[row[CONFLICT_COLUMN]] = row
+        return 200, {
+            'success': True,
+            'message': 'REMA products successfully imported from Python scraper',
+            'import': {'totalImported': len(rows), 'newProducts': new, 'updatedProducts': len(rows) - new, 'errors': []}
+        }
+
+    def rest_select(self, table_name: str, query: dict) -> list:
+        """PostgREST GET subset: select=col,alias:col->>key, col=like.prefix*, order=col, limit/offset"""
+        columns = []
+        for item in query.get('select', ['*'])[0].split(','):
+            alias, _, source = item.rpartition(':')
+            column, _, key = source.partition('->>')
+            columns.append((alias or source, column, key))
+        filters = {name: values[0][len('like.'):].rstrip('*') for name, values in query.items()
+                   if values[0].startswith('like.')}
+        with self.lock:
+            rows = [row for row in self.tables.get(table_name, {}).values()
+                    if all(str(row.get(name, '')).startswith(prefix) for name, prefix in filters.items())]
+        if 'order' in query:
+            rows.sort(key=lambda row: str(row.get(query['order'][0])))
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', [str(len(rows))])[0])
+        selected = []
+        for row in rows[offset:offset + limit]:
+            if columns == [('*', '*', '')]:
+                selected.append(row)
+                continue
+            selected.append({alias: (row.get(column) or {}).get(key) if key else row.get(column)
+                             for alias, column, key in columns})
+        return selected
+
+    def rest_write(self, table_name: str, query: dict, rows):
+        """(status, error body) for a PostgREST POST: insert, or upsert with ?on_conflict=<column>"""
+        rows = rows if isinstance(rows, list) else [rows]
+        conflict = query.get('on_conflict', [None])[0]
+        time.sleep(self.rest_latency)
+        with self.lock:
+            table = self.tables.setdefault(table_name, {})
+            if conflict:
+                keys = [row.get(conflict) for row in rows]
+                if len(set(keys)) != len(keys):
+                    return 500, {'code': '21000', 'message': 'ON CONFLICT DO UPDATE command cannot affect row a second time'}
+                for key, row in zip(keys, rows):
+                    table[key] = {**table.get(key, {}), **row}
+            else:
+                for row in rows:
+                    table[len(table) + 1] = row
+        return 201, None
+
+def encode_body(payload) -> str:
+    return base64.b64encode(json.dumps(payload, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 keep-alive handler dispatching to the MockRemaServer"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, route: str, status: int, payload, started: float, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.mock.log.record(route, status, len(body), time.perf_counter() - started)
+
+    def do_GET(self):
+        mock = self.server.mock
+        started = time.perf_counter()
+        parsed = urlparse(self.path)
+        route, status, payload = mock.route(parsed.path, parse_qs(parsed.query))
+        time.sleep(mock.delay())
+
+        failure = mock.injected_failure()
+        if failure:
+            self.send_json(route, failure, {'message': 'Injected failure'}, started,
+                           {'Retry-After': '1'} if failure == 429 else None)
+            return
+
+        headers = {}
+        if mock.etag and status == 200 and route == 'detail':
+            tag = '"' + hashlib.blake2b(json.dumps(payload, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest() + '"'
+            headers['ETag'] = tag
+            if self.headers.get('If-None-Match') == tag:
+                self.send_json(route, 304, None, started, headers)
+                return
+        self.send_json(route, status, payload, started, headers)
+
+    def do_POST(self):
+        mock = self.server.mock
+        started = time.perf_counter()
+        length = int(self.headers.get('Content-Length') or 0)
+        parsed = urlparse(self.path)
+        if parsed.path == IMPORT_ROUTE or parsed.path.startswith('/rest/v1/'):
+            self.handle_import(parsed, length, started)
+            return
+        if parsed.path != '/v1/extract':
+            self.rfile.read(length)
+            self.send_json('other', 404, {'message': 'Not found'}, started)
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self.send_json('zyte', 400, {'detail': 'Invalid JSON'}, started)
+            return
+        time.sleep(mock.delay(zyte=True))
+
+        failure = mock.injected_failure(zyte=True)
+        if failure:
+            self.send_json('zyte', failure, {'detail': 'Injected failure'}, started,
+                           {'Retry-After': '1'} if failure == 429 else None)
+            return
+        self.send_json('zyte', 200, mock.zyte_extract(payload), started)
+
+    def handle_import(self, parsed, length: int, started: float):
+        mock = self.server.mock
+        route = 'import' if parsed.path == IMPORT_ROUTE else 'rest'
+        try:
+            payload = json.loads(self.rfile.read(length) or b'null')
+        except json.JSONDecodeError:
+            self.send_json(route, 400, {'message': 'Invalid JSON'}, started)
+            return
+
+        failure = mock.injected_failure()
+        if failure:
+            self.send_json(route, failure, {'message': 'Injected failure'}, started,
+                           {'Retry-After': '1'} if failure == 429 else None)
+            return
+        if route == 'import':
+            status, body = mock.import_route(payload or {})
+        else:
+            status, body = mock.rest_write(parsed.path[len('/rest/v1/'):], parse_qs(parsed.query), payload or [])
+        self.send_json(route, status, body, started)
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Mock REMA API / Zyte server for offline scraper runs')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--data', nargs='+', default=[DEFAULT_DATA],
+                        help=f'JSONL files or globs with recorded products (default: {DEFAULT_DATA})')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per REMA request in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency per request, 0..N ms')
+    parser.add_argument('--zyte-latency', type=float, default=0.0, help='Added latency per Zyte request in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 502 (Zyte: 520)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests rejected with 429')
+    parser.add_argument('--etag', action='store_true', help='Send ETags on product details and answer 304s')
+    parser.add_argument('--import-latency', type=float, default=0.0,
+                        help='Added latency per product on the import-rema-products route in ms')
+    parser.add_argument('--rest-latency', type=float, default=0.0, help='Added latency per PostgREST request in ms')
+    parser.add_argument('--seed', type=int, help='Random seed for latency and failure injection')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    records = load_records(args.data)
+    if not records:
+        print(f"❌ No recorded products found in {args.data}")
+        return
+
+    server = MockRemaServer(records, host=args.host, port=args.port, latency=args.latency / 1000,
+                            jitter=args.jitter / 1000, zyte_latency=args.zyte_latency / 1000,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                            etag=args.etag, seed=args.seed, import_latency=args.import_latency / 1000,
+                            rest_latency=args.rest_latency / 1000)
+    print(f"🧪 Mock REMA API serving {len(records)} products on {server.url}")
+    print(f"   REMA_API_URL={server.url}")
+    print(f"   ZYTE_API_URL={server.url}/v1/extract")
+    print(f"   IMPORT_API_URL={server.url}{IMPORT_ROUTE}")
+    print(f"   SUPABASE_URL={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"📊 {json.dumps(server.log.summary(), ensure_ascii=False)}")
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Product content hashing
+Canonical hashes of REMA product records so change detection is a hash comparison.
+"""
+
+import hashlib
+import json
+
+HASH_FIELDS = ('price_hash', 'content_hash')
+
+# Fields that change without the product itself changing
+VOLATILE_FIELDS = HASH_FIELDS + ('last_updated', 'lastUpdated')
+VOLATILE_DEPARTMENT_FIELDS = ('products_last_modified_at',)
+
+def canonical_json(value) -> str:
+    """Serialize with sorted keys and no whitespace so equal data gives equal text"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+def hash_value(value) -> str:
+    return hashlib.blake2b(canonical_json(value).encode('utf-8'), digest_size=16).hexdigest()
+
+def hashable_record(product: dict) -> dict:
+    """Copy of the record without hash and volatile fields"""
+    record = {key: value for key, value in product.items() if key not in VOLATILE_FIELDS}
+    department = record.get('department')
+    if isinstance(department, dict):
+        record['department'] = {
+            key: value for key, value in department.items() if key not in VOLATILE_DEPARTMENT_FIELDS
+        }
+    return record
+
+def price_hash(product: dict) -> str:
+    """Hash of the full prices block (price, offers, dates, unit prices, deposit)"""
+    return hash_value(product.get('prices') or [])
+
+def content_hash(product: dict) -> str:
+    """Hash of the whole record"""
+    return hash_value(hashable_record(product))
+
+def record_content_hash(product: dict) -> str:
+    """The content_hash the scraper stamped on the record, computed if it has none"""
+    return product.get('content_hash') or content_hash(product)
+
+def stamp_hashes(product: dict) -> dict:
+    """Compute both hashes once and store them on the record"""
+    product['price_hash'] = price_hash(product)
+    product['content_hash'] = content_hash(product)
+    return product
+
+def diff_records(old, new, path: str = '') -> list:
+    """List of {field, old, new} for every leaf that differs between two records"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(set(old) | set(new), key=str):
+            if not path and key in VOLATILE_FIELDS:
+                continue
+            field = f"{path}.{key}" if path else str(key)
+            changes.extend(diff_records(old.get(key), new.get(key), field))
+        return changes
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            changes.extend(diff_records(old_item, new_item, f"{path}[{index}]"))
+        return changes
+
+    if old != new:
+        return [{'field': path, 'old': old, 'new': new}]
+    return []
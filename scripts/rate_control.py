@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Rate control
+Token bucket plus an AIMD controller that adapts request rate and
+concurrency to how the server is coping (latency, 429s, timeouts).
+Works from asyncio code (slot) and from threads (slot_blocking).
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by concurrent requests"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token now (possibly going into debt) and return seconds to wait for it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            self.rate = rate
+            self.capacity = max(1.0, rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+class AdaptiveRateController:
+    """Additive-increase / multiplicative-decrease control of rate and concurrency.
+
+    Every `limit` clean responses the rate grows by `rate_step` and the
+    concurrency limit by one. A 429/503, a timeout, or a latency spike
+    (fast latency average above `spike_factor` x the slow baseline) halves
+    both, at most once per `cooldown` seconds.
+    """
+
+    def __init__(self, rate: float = 10.0, limit: int = 8, min_rate: float = 0.5, max_rate: float = 50.0,
+                 min_limit: int = 1, max_limit: int = 32, rate_step: float = 1.0,
+                 spike_factor: float = 3.0, cooldown: float = 2.0, name: str = "requests"):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.rate_step = rate_step
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.blocking_slots = threading.Condition(self.lock)
+        self.async_slots = None
+        self.configure(rate, limit)
+
+    def configure(self, rate: float, limit: int, max_rate: float = None, max_limit: int = None):
+        """Reset the controller to new starting values (e.g. from command line flags)"""
+        if max_rate is not None:
+            self.max_rate = max_rate
+        if max_limit is not None:
+            self.max_limit = max_limit
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.limit = min(self.max_limit, max(self.min_limit, limit))
+        self.bucket = TokenBucket(self.rate)
+        self.in_flight = 0
+        self.clean_streak = 0
+        self.fast_latency = None
+        self.slow_latency = None
+        self.samples = 0
+        self.throttled = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+        self.last_decrease = 0.0
+        self.started_at = time.monotonic()
+        self.history = [(0.0, self.rate, self.limit, 'start')]
+
+    def _change(self, rate: float, limit: int, reason: str):
+        self.rate = rate
+        self.limit = limit
+        self.bucket.set_rate(rate)
+        self.history.append((round(time.monotonic() - self.started_at, 1), round(rate, 2), limit, reason))
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.decreases += 1
+        self.clean_streak = 0
+        self._change(max(self.min_rate, self.rate / 2), max(self.min_limit, self.limit // 2), reason)
+
+    def record_success(self, latency: float):
+        with self.lock:
+            self.samples += 1
+            if self.fast_latency is None:
+                self.fast_latency = self.slow_latency = latency
+            else:
+                self.fast_latency += 0.3 * (latency - self.fast_latency)
+                self.slow_latency += 0.02 * (latency - self.slow_latency)
+
+            if self.samples > 20 and self.fast_latency > self.spike_factor * self.slow_latency:
+                self._decrease('latency')
+                return
+
+            self.clean_streak += 1
+            if self.clean_streak >= self.limit and (self.rate < self.max_rate or self.limit < self.max_limit):
+                self.clean_streak = 0
+                self.increases += 1
+                self._change(min(self.max_rate, self.rate + self.rate_step),
+                             min(self.max_limit, self.limit + 1), 'increase')
+
+    def record_throttle(self, status_code: int):
+        with self.lock:
+            self.throttled += 1
+            self._decrease(str(status_code))
+
+    def record_error(self, reason: str):
+        with self.lock:
+            self.errors += 1
+            self._decrease(reason)
+
+    def _release(self):
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot and one rate token for an async request"""
+        if self.async_slots is None:
+            self.async_slots = asyncio.Condition()
+        async with self.async_slots:
+            await self.async_slots.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            await asyncio.sleep(self.bucket.reserve())
+            yield
+        finally:
+            async with self.async_slots:
+                self._release()
+                self.async_slots.notify_all()
+
+    @contextmanager
+    def slot_blocking(self):
+        """Hold one concurrency slot and one rate token for a request made from a thread"""
+        with self.blocking_slots:
+            self.blocking_slots.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            time.sleep(self.bucket.reserve())
+            yield
+        finally:
+            with self.blocking_slots:
+                self._release()
+                self.blocking_slots.notify_all()
+
+    def summary(self) -> dict:
+        with self.lock:
+            rates = [entry[1] for entry in self.history]
+            return {
+                'name': self.name,
+                'rate': round(self.rate, 2),
+                'limit': self.limit,
+                'min_rate': min(rates),
+                'max_rate': max(rates),
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'history': list(self.history)
+            }
+
+    def print_summary(self, log=print, max_entries: int = 10):
+        summary = self.summary()
+        log(f"🎚️  Adaptive {summary['name']}: now {summary['rate']} req/s x {summary['limit']} "
+            f"(range {summary['min_rate']}-{summary['max_rate']} req/s, "
+            f"{summary['increases']} up / {summary['decreases']} down, {summary['throttled']} throttled)")
+        history = summary['history']
+        # Start, every decrease, and where the rate ended up; increases are implied
+        shown = [entry for entry in history[1:-1] if entry[3] != 'increase'][-(max_entries - 2):]
+        shown = history[:1] + shown + (history[-1:] if len(history) > 1 else [])
+        for elapsed, rate, limit, reason in shown:
+            log(f"   {elapsed:>7.1f}s  {rate:>6} req/s  x{limit:<3} {reason}")
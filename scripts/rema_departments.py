@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+REMA departments
+Maps REMA department ids (and, failing that, names) to supermarket categories.
+Kept free of side effects so the importer can use it without loading the scraper.
+"""
+
+# Department ID to category name mapping - UPDATED WITH NEW REMA API IDs (2025)
+DEPARTMENT_MAPPING = {
+    # NEW REMA API department IDs (September 2025)
+    10: "Brød og kager",  # Brød & Bavinchi
+    20: "Frugt og grønt",  # Frugt og grønt
+    30: "Kød og fisk",  # Kød og fisk
+    40: "Kød og fisk",  # Køl - kølede madvarer som leverpostej, sild, etc.
+    50: "Ukategoriseret",  # Frost - mapped to Uncategorized since not in user list
+    60: "Mejeri og køl",  # Mejeri - changed from "Mejeri" to match user categories
+    70: "Mejeri og køl",  # Ost m.v. - already correct
+    80: "Kolonial",  # Kolonial
+    90: "Drikkevarer",  # Drikkevarer
+    100: "Husholdning",  # Husholdning
+    110: "Baby og familie",  # Baby og familie
+    120: "Personlig pleje",  # Personlig pleje
+    130: "Slik og snacks",  # Slik
+    140: "Kiosk",  # Kiosk
+    160: "Ukategoriseret"  # "Nemt og hurtigt" - mapped to Uncategorized since not in user list
+    
+    # OLD MAPPINGS (no longer valid):
+    # 81, 82, 83, 84, 85, 86, 87, 88, 89 - these IDs no longer exist in REMA API
+}
+
+def map_department(department: dict) -> tuple:
+    """Map a REMA department object to (category, subcategory)"""
+    if not department or 'id' not in department:
+        return "Ukategoriseret", "Ukategoriseret"
+    
+    dept_id = department['id']
+    dept_name = department.get('name', '')
+    
+    # Try to map by ID first
+    category_name = DEPARTMENT_MAPPING.get(dept_id, None)
+    
+    if not category_name:
+        # Fallback: try to map by department name
+        dept_name_lower = dept_name.lower()
+        if 'kolonial' in dept_name_lower:
+            category_name = "Kolonial"
+        elif 'frugt' in dept_name_lower or 'grønt' in dept_name_lower:
+            category_name = "Frugt og grønt"
+        elif 'kød' in dept_name_lower or 'fisk' in dept_name_lower:
+            category_name = "Kød og fisk"
+        elif 'mejeri' in dept_name_lower or 'ost' in dept_name_lower:
+            category_name = "Mejeri"
+        elif 'frost' in dept_name_lower:
+            category_name = "Frost"
+        elif 'brød' in dept_name_lower or 'kage' in dept_name_lower:
+            category_name = "Brød og kager"
+        elif 'drikke' in dept_name_lower:
+            category_name = "Drikkevarer"
+        else:
+            category_name = f"Ukategoriseret (dept {dept_id}: {dept_name})"
+    
+    return category_name, dept_name
@@ -13,6 +13,17 @@ import time
 import argparse
 from pathlib import Path
 
+from http_cache import ResponseCache
+from http_client import create_async_client, phase_timeout
+from jsonl_io import AsyncJsonlWriter, load_jsonl
+from product_hash import content_hash, diff_records, hashable_record, price_hash, stamp_hashes
+from rate_control import AdaptiveRateController
+from rema_departments import map_department
+from rema_store import DepartmentWatermarkStore, ProductSnapshotStore
+from retry_policy import RetryPolicy
+from run_metrics import RunMetrics
+from scrape_checkpoint import ScrapeCheckpoint
+
 # Food department IDs (excluding "Husholdning" which is non-food)
 FOOD_DEPARTMENTS = [
     1,   # Brød & Bavinchi
@@ -27,13 +38,34 @@ FOOD_DEPARTMENTS = [
 ]
 
 # Configuration
-BASE_URL = "https://api.digital.rema1000.dk"
+BASE_URL = os.getenv("REMA_API_URL", "https://api.digital.rema1000.dk")  # Overridable for mock_rema_server.py
 HEADERS = {
     "accept": "application/json",
     "user-agent": "Mozilla/5.0 (NicolaiScraper/0.1)"
 }
 PER_PAGE = 100
 OUT_DIR = "data"
+DEFAULT_CONCURRENCY = 8  # Starting parallel requests (adapted at runtime)
+DEFAULT_RATE = 10.0  # Starting requests per second (adapted at runtime)
+DEFAULT_MAX_CONCURRENCY = 32  # Ceiling for the adaptive controller
+DEFAULT_MAX_RATE = 50.0  # Ceiling for the adaptive controller
+DEFAULT_PAGE_CONCURRENCY = 4  # Parallel listing pages
+PAGE_RETRIES = 3  # Extra rounds for pages that failed
+REORDER_WINDOW = 500  # Max finished-but-unwritten products held while enriching
+WATERMARK_PROBE_CANDIDATES = 3  # Sample products tried per department
+WATERMARKS_FILE = os.path.join(OUT_DIR, "department_watermarks.json")
+SNAPSHOT_FILE = os.path.join(OUT_DIR, "rema_snapshot.sqlite3")
+CACHE_FILE = os.path.join(OUT_DIR, "http_cache.sqlite3")
+DEFAULT_CACHE_MB = 500
+METRICS_FILE = os.path.join(OUT_DIR, "rema_metrics.json")
+
+# Shared by every request in the run; its counters end up in the run stats
+RETRY_POLICY = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=30.0, budget=1000)
+RESPONSE_CACHE = None  # Set by main() unless --no-cache
+METRICS = RunMetrics("rema_scraper")
+RATE_CONTROLLER = AdaptiveRateController(rate=DEFAULT_RATE, limit=DEFAULT_CONCURRENCY,
+                                         max_rate=DEFAULT_MAX_RATE, max_limit=DEFAULT_MAX_CONCURRENCY,
+                                         rate_step=2.0, name="REMA API")
 
 # Create output directory
 os.makedirs(OUT_DIR, exist_ok=True)
@@ -49,40 +81,228 @@ def parse_arguments():
                        help='Scrape specific batch: 1(1-2), 2(3-4), 3(5-6), 4(7-8), 5(9)')
     parser.add_argument('--delta', action='store_true',
                        help='Run in delta update mode (check for price changes and offer updates)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'Starting parallel requests (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                       help=f'Starting requests per second (default: {DEFAULT_RATE:g})')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                       help=f'Upper bound for adaptive concurrency (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                       help=f'Upper bound for adaptive requests per second (default: {DEFAULT_MAX_RATE:g})')
+    parser.add_argument('--page-concurrency', type=int, default=DEFAULT_PAGE_CONCURRENCY,
+                       help=f'Max parallel listing pages, 1 = serial walk (default: {DEFAULT_PAGE_CONCURRENCY})')
+    parser.add_argument('--snapshot', default=SNAPSHOT_FILE,
+                       help=f'Product snapshot database used by delta mode (default: {SNAPSHOT_FILE})')
+    parser.add_argument('--cache', default=CACHE_FILE,
+                       help=f'On-disk ETag/Last-Modified response cache (default: {CACHE_FILE})')
+    parser.add_argument('--cache-size-mb', type=int, default=DEFAULT_CACHE_MB,
+                       help=f'Max response cache size before LRU eviction (default: {DEFAULT_CACHE_MB})')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Disable conditional requests and the response cache')
+    parser.add_argument('--resume', action='store_true',
+                       help='Resume an interrupted full scrape from its checkpoint and append to its output')
+    parser.add_argument('--all-departments', action='store_true',
+                       help='Delta mode: re-check every department, ignoring stored watermarks')
+    parser.add_argument('--metrics', default=METRICS_FILE,
+                       help=f'Per-phase run metrics as JSON (default: {METRICS_FILE})')
+    parser.add_argument('--prometheus',
+                       help='Also write the run metrics in Prometheus text format to this file')
     return parser.parse_args()
 
-async def get_json(url: str, client: httpx.AsyncClient) -> dict:
-    """Make HTTP request and return JSON response"""
-    try:
-        response = await client.get(url, headers=HEADERS, timeout=30.0)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
-        return {}
+class NotFound(dict):
+    """Empty response for a 404: the resource is gone, not temporarily unreachable"""
 
-async def list_all_products(client: httpx.AsyncClient, test_mode: bool = False, limit: int = None, batch: int = None) -> list:
-    """List all products from REMA's API with proper pagination"""
-    all_products = []
-    page = 1
-    per_page = 100
+NOT_FOUND = NotFound()
+
+async def get_json(url: str, client: httpx.AsyncClient, phase: str = 'detail') -> dict:
+    """Make HTTP request and return JSON response, retrying transient failures.
+
+    With a response cache configured, requests carry the cached validators
+    and a 304 is answered from disk. A 404 returns NOT_FOUND, every other
+    failure an empty dict (both falsy). Every attempt is recorded in METRICS
+    under `phase`.
+    """
+    cache = RESPONSE_CACHE
+    conditional = cache.conditional_headers(url) if cache else {}
+    attempt = 0
+    while True:
+        async with RATE_CONTROLLER.slot():
+            METRICS.gauge(phase, 'in_flight', RATE_CONTROLLER.in_flight)
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, headers=conditional, timeout=phase_timeout(phase))
+            except Exception as e:
+                response = None
+                error = e
+            latency = time.perf_counter() - started
+        
+        if response is None:
+            METRICS.record_request(phase, type(error).__name__, 0, latency)
+        else:
+            METRICS.record_request(phase, response.status_code, len(response.content), latency)
+        
+        if response is None:
+            # Timeouts, resets and connection errors are always worth another try; other
+            # request errors (undecodable body, redirect loop, ...) fail this request only
+            delay = None
+            if isinstance(error, httpx.TransportError):
+                RATE_CONTROLLER.record_error(type(error).__name__)
+                delay = RETRY_POLICY.next_delay(attempt, type(error).__name__)
+            if delay is None:
+                print(f"Error fetching {url}: {error}")
+                return {}
+        elif not RETRY_POLICY.is_retryable_status(response.status_code):
+            RATE_CONTROLLER.record_success(latency)
+            if response.status_code == 304 and cache:
+                body = cache.hit(url)
+                if body is not None:
+                    METRICS.count(phase, 'cache_hits')
+                    return json.loads(body)
+                # Entry was evicted while we waited; ask again without validators
+                conditional = {}
+                continue
+            if response.status_code == 404:
+                return NOT_FOUND
+            try:
+                response.raise_for_status()
+                data = response.json()
+                if cache:
+                    cache.store(url, response.headers, response.content)
+                return data
+            except Exception as e:
+                print(f"Error fetching {url}: {e}")
+                return {}
+        else:
+            if response.status_code in (429, 503):
+                RATE_CONTROLLER.record_throttle(response.status_code)
+            else:
+                RATE_CONTROLLER.record_error(str(response.status_code))
+            delay = RETRY_POLICY.next_delay(attempt, str(response.status_code), response.headers.get('retry-after'))
+            if delay is None:
+                print(f"Error fetching {url}: HTTP {response.status_code} after {attempt + 1} attempts")
+                return {}
+        
+        METRICS.count(phase, 'retries')
+        await asyncio.sleep(delay)
+        attempt += 1
+
+class LatencyStats:
+    """Collect per-request latencies and summarize them"""
+    
+    def __init__(self):
+        self.samples = []
+        self.failures = 0
+    
+    def record(self, seconds: float, ok: bool = True):
+        self.samples.append(seconds)
+        if not ok:
+            self.failures += 1
+    
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def summary(self) -> dict:
+        count = len(self.samples)
+        return {
+            "requests": count,
+            "failures": self.failures,
+            "mean_ms": round(sum(self.samples) / count * 1000, 1) if count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "max_ms": round(max(self.samples) * 1000, 1) if count else 0.0
+        }
+
+async def fetch_page(client: httpx.AsyncClient, page: int, per_page: int = PER_PAGE) -> dict:
+    """Fetch a single listing page"""
+    url = f"{BASE_URL}/api/v3/products?per_page={per_page}&page={page}"
+    return await get_json(url, client, phase='list')
+
+async def list_all_products(client: httpx.AsyncClient, test_mode: bool = False, limit: int = None, batch: int = None,
+                            concurrency: int = DEFAULT_PAGE_CONCURRENCY, checkpoint: ScrapeCheckpoint = None) -> tuple:
+    """List all products, fanning out over pages once page 1 reveals the page count.
+
+    Returns (products, complete); complete is False when pages were given up on
+    or the listing was cut short, so the result is not the whole catalogue.
+    """
+    per_page = PER_PAGE
+    pages = checkpoint.load_listing() if checkpoint else {}
     
     print(f"🔍 Scraping all products from REMA's API...")
     
-    while True:
-        if test_mode and limit and len(all_products) >= limit:
-            break
-            
-        print(f"📦 Page {page}: Fetching {per_page} products...")
-        
-        # Get products from current page
-        url = f"{BASE_URL}/api/v3/products?per_page={per_page}&page={page}"
-        data = await get_json(url, client)
+    if 1 in pages and checkpoint.last_page:
+        last_page = checkpoint.last_page
+        print(f"♻️  Resuming listing: {len(pages)}/{last_page} pages already fetched")
+    else:
+        print(f"📦 Page 1: Fetching {per_page} products...")
         
+        data = await fetch_page(client, 1, per_page)
         if not data or 'data' not in data:
-            print(f"⚠️ No data received from page {page}")
+            print(f"⚠️ No data received from page 1")
+            return [], False
+        
+        pagination = data.get('meta', {}).get('pagination')
+        if not pagination or concurrency <= 1:
+            return await list_products_serial(client, data, test_mode, limit)
+        
+        last_page = pagination.get('last_page', 1)
+        total = pagination.get('total', 0)
+        print(f"📊 Page 1/{last_page} - Total: {total} products")
+        
+        pages[1] = data['data']
+        if checkpoint:
+            checkpoint.record_page(1, data['data'], last_page)
+    
+    if test_mode and limit:
+        last_page = min(last_page, -(-limit // per_page))
+    
+    pending = [page for page in range(2, last_page + 1) if page not in pages]
+    
+    for attempt in range(1, PAGE_RETRIES + 2):
+        if not pending:
             break
-            
+        if attempt > 1:
+            print(f"🔁 Retrying {len(pending)} failed pages (attempt {attempt})...")
+            await asyncio.sleep(attempt)
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def load(page: int):
+            async with semaphore:
+                page_data = await fetch_page(client, page, per_page)
+            if page_data and 'data' in page_data:
+                pages[page] = page_data['data']
+                if checkpoint:
+                    checkpoint.record_page(page, page_data['data'])
+                if len(pages) % 25 == 0:
+                    print(f"📦 Fetched {len(pages)}/{last_page} pages...")
+        
+        await asyncio.gather(*(load(page) for page in pending))
+        pending = [page for page in pending if page not in pages]
+    
+    if pending:
+        print(f"⚠️ Gave up on {len(pending)} pages: {pending[:10]}{'...' if len(pending) > 10 else ''}")
+    
+    all_products = [product for page in sorted(pages) if page <= last_page for product in pages[page]]
+    
+    print(f"✅ Total products found: {len(all_products)}")
+    if test_mode and limit:
+        return all_products[:limit], False
+    return all_products, not pending
+
+async def list_products_serial(client: httpx.AsyncClient, first_page: dict, test_mode: bool = False, limit: int = None) -> tuple:
+    """Walk listing pages one at a time (used when pagination metadata is missing); returns (products, complete)"""
+    all_products = []
+    complete = True
+    data = first_page
+    page = 1
+    per_page = PER_PAGE
+    
+    while True:
         products = data['data']
         if not products:
             print(f"✅ No more products on page {page}")
@@ -91,6 +311,9 @@ async def list_all_products(client: httpx.AsyncClient, test_mode: bool = False,
         print(f"📦 Page {page}: Found {len(products)} products")
         all_products.extend(products)
         
+        if test_mode and limit and len(all_products) >= limit:
+            break
+        
         # Check pagination info
         if 'meta' in data and 'pagination' in data['meta']:
             pagination = data['meta']['pagination']
@@ -107,228 +330,335 @@ async def list_all_products(client: httpx.AsyncClient, test_mode: bool = False,
             # Fallback: if no pagination info, stop after reasonable number of pages
             if page > 50:
                 print("⚠️ Reached page limit (50), stopping")
+                complete = False
                 break
         
         page += 1
         
-        # Small delay to be respectful to the API
-        await asyncio.sleep(0.1)
+        print(f"📦 Page {page}: Fetching {per_page} products...")
+        data = await fetch_page(client, page, per_page)
+        
+        if not data or 'data' not in data:
+            print(f"⚠️ No data received from page {page}")
+            complete = False
+            break
     
     print(f"✅ Total products found: {len(all_products)}")
-    return all_products[:limit] if test_mode and limit else all_products
+    if test_mode and limit:
+        return all_products[:limit], False
+    return all_products, complete
 
-async def delta_price_check(client: httpx.AsyncClient, existing_products: list) -> list:
-    """Check for price changes and offer status updates (delta update)"""
-    print(f"🔄 Running delta price check for {len(existing_products)} existing products...")
+async def probe_department_watermarks(client: httpx.AsyncClient, products_by_dept: dict) -> dict:
+    """Read each department's products_last_modified_at via one sample product per department"""
+    current = {}
     
-    updated_products = []
-    changes_found = 0
+    async def probe(dept_id, products):
+        # The first sample may have been delisted, so try a few
+        for product in products[:WATERMARK_PROBE_CANDIDATES]:
+            url = f"{BASE_URL}/api/v3/products/{product['id']}?include=department"
+            data = await get_json(url, client, phase='delta')
+            department = (data.get('data') or {}).get('department') if data else None
+            if department and department.get('products_last_modified_at'):
+                current[dept_id] = department['products_last_modified_at']
+                return
     
-    for i, existing_product in enumerate(existing_products):
-        if i % 100 == 0:
-            print(f"🔄 Checking product {i+1}/{len(existing_products)}...")
-            
-        product_id = existing_product.get('id')
-        if not product_id:
+    await asyncio.gather(*(probe(dept_id, products) for dept_id, products in products_by_dept.items()))
+    return current
+
+async def select_changed_products(client: httpx.AsyncClient, existing_products: list,
+                                  watermarks: DepartmentWatermarkStore) -> tuple:
+    """Drop products whose department watermark has not moved; returns (products, current watermarks)"""
+    products_by_dept = {}
+    unassigned = []
+    for product in existing_products:
+        if not product.get('id'):
             continue
+        dept_id = (product.get('department') or {}).get('id')
+        if dept_id is None:
+            unassigned.append(product)
+        else:
+            products_by_dept.setdefault(dept_id, []).append(product)
+    
+    print(f"🏬 Probing watermarks for {len(products_by_dept)} departments...")
+    current = await probe_department_watermarks(client, products_by_dept)
+    
+    selected = list(unassigned)
+    for dept_id, products in sorted(products_by_dept.items()):
+        if watermarks.has_changed(dept_id, current.get(dept_id)):
+            print(f"   🔄 Department {dept_id}: changed ({watermarks.get(dept_id)} → {current.get(dept_id)}), {len(products)} products")
+            selected.extend(products)
+        else:
+            print(f"   ⏸️  Department {dept_id}: unchanged, skipping {len(products)} products")
+    
+    print(f"🏬 {len(selected)}/{len(existing_products)} products in changed departments")
+    return selected, current
+
+async def delta_price_check(client: httpx.AsyncClient, existing_products: list,
+                            watermarks: DepartmentWatermarkStore = None,
+                            concurrency: int = DEFAULT_CONCURRENCY) -> tuple[list, list, list]:
+    """Check for price changes and offer status updates (delta update).
+
+    Returns (updated products, ids of delisted products, per-product diffs of
+    what changed). A product whose detail URL answers 404 counts as delisted;
+    any other failure keeps its department's watermark where it was.
+    """
+    current_watermarks = {}
+    if watermarks is not None:
+        existing_products, current_watermarks = await select_changed_products(client, existing_products, watermarks)
+    
+    total = len(existing_products)
+    print(f"🔄 Running delta price check for {total} existing products...")
+    
+    results = [None] * total
+    failed_departments = set()
+    next_index = 0
+    checked = 0
+    
+    async def worker():
+        nonlocal next_index, checked
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            existing_product = existing_products[index]
             
-        # Get current price info (without full details)
-        price_url = f"{BASE_URL}/api/v3/products/{product_id}"
-        current_data = await get_json(price_url, client)
-        
-        if not current_data or 'data' not in current_data:
-            continue
+            product_id = existing_product.get('id')
+            if not product_id:
+                continue
             
-        current_product = current_data['data']
-        current_prices = current_product.get('prices', [])
-        
-        # Check for price changes
-        price_changed = False
-        offer_status_changed = False
+            # Get current price info (without full details)
+            price_url = f"{BASE_URL}/api/v3/products/{product_id}"
+            current_data = await get_json(price_url, client, phase='delta')
+            
+            checked += 1
+            if checked % 100 == 0:
+                print(f"🔄 Checked {checked}/{total} products...")
+            
+            if current_data is NOT_FOUND:
+                results[index] = (existing_product, None, False)
+                continue
+            if not current_data or 'data' not in current_data:
+                failed_departments.add((existing_product.get('department') or {}).get('id'))
+                continue
+            
+            # Hashes are stamped at scrape time; older snapshot rows may predate them
+            existing_content_hash = existing_product.get('content_hash') or content_hash(existing_product)
+            existing_price_hash = existing_product.get('price_hash') or price_hash(existing_product)
+            
+            updated_product = stamp_hashes({**existing_product, **current_data['data']})
+            if updated_product['content_hash'] != existing_content_hash:
+                results[index] = (existing_product, updated_product,
+                                  updated_product['price_hash'] != existing_price_hash)
+    
+    # Pacing comes from the shared adaptive controller inside get_json
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    
+    updated_products = []
+    removed_ids = []
+    diffs = []
+    price_changes = 0
+    
+    for result in results:
+        if result is None:
+            continue
+        existing_product, updated_product, price_changed = result
         
-        # Compare with existing product
-        existing_prices = existing_product.get('prices', [])
+        if updated_product is None:
+            removed_ids.append(existing_product['id'])
+            diffs.append({'id': existing_product['id'], 'name': existing_product.get('name'), 'removed': True})
+            continue
         
-        if len(current_prices) != len(existing_prices):
-            price_changed = True
-        else:
-            for i, (current_price, existing_price) in enumerate(zip(current_prices, existing_prices)):
-                if (current_price.get('price') != existing_price.get('price') or
-                    current_price.get('is_advertised') != existing_price.get('is_advertised') or
-                    current_price.get('is_campaign') != existing_price.get('is_campaign')):
-                    price_changed = True
-                    break
+        updated_products.append(updated_product)
+        diffs.append({
+            'id': updated_product['id'],
+            'name': updated_product.get('name'),
+            'price_changed': price_changed,
+            'changes': diff_records(hashable_record(existing_product), hashable_record(updated_product))
+        })
         
         if price_changed:
-            changes_found += 1
-            # Update the product with new price info
-            updated_product = {**existing_product, **current_product}
-            updated_products.append(updated_product)
-            
-            if changes_found <= 5:  # Show first 5 changes
+            price_changes += 1
+            if price_changes <= 5:  # Show first 5 price changes
+                existing_prices = existing_product.get('prices', [])
+                current_prices = updated_product.get('prices', [])
                 old_price = existing_prices[0].get('price') if existing_prices else 'Unknown'
                 new_price = current_prices[0].get('price') if current_prices else 'Unknown'
                 print(f"💰 Price change: {existing_product.get('name')} - {old_price} → {new_price}")
-        
-        # Small delay to be respectful to the API
-        await asyncio.sleep(0.05)
     
-    print(f"✅ Delta check complete: {changes_found} products with changes")
-    return updated_products
-
-async def upsert_products(products: list, client: httpx.AsyncClient, mode: str = "full") -> dict:
-    """Upsert products: update existing ones and add new ones without destroying data"""
-    print(f"🔄 Running {mode} upsert for {len(products)} products...")
+    if watermarks is not None:
+        # Only advance departments whose products were all re-checked
+        for dept_id, modified_at in current_watermarks.items():
+            if dept_id not in failed_departments:
+                watermarks.update(dept_id, modified_at)
     
-    stats = {
-        "total": len(products),
+    print(f"✅ Delta check complete: {len(updated_products)} products with changes ({price_changes} price changes), "
+          f"{len(removed_ids)} delisted")
+    return updated_products, removed_ids, diffs
+
+def new_upsert_stats() -> dict:
+    return {
+        "total": 0,
         "updated": 0,
         "added": 0,
         "unchanged": 0,
         "errors": 0
     }
+
+def count_upsert(stats: dict, product: dict, mode: str = "full"):
+    """Classify one product into the upsert stats"""
+    stats["total"] += 1
     
-    for i, product in enumerate(products):
-        if i % 100 == 0:
-            print(f"🔄 Processing product {i+1}/{len(products)}...")
-            
-        product_id = product.get('id')
-        if not product_id:
-            stats["errors"] += 1
-            continue
-            
-        try:
-            # Check if product exists (you would implement this based on your database)
-            # For now, we'll assume all products are "new" since we're doing a full scrape
-            if mode == "full":
-                # Full scrape mode - treat as new product
-                stats["added"] += 1
-            elif mode == "delta":
-                # Delta mode - check if price changed
-                # This would compare with existing database record
-                stats["updated"] += 1
-            else:
-                stats["unchanged"] += 1
-                
-        except Exception as e:
-            print(f"❌ Error processing product {product_id}: {e}")
-            stats["errors"] += 1
-            continue
-        
-        # Small delay to be respectful to the API
-        await asyncio.sleep(0.01)
+    product_id = product.get('id')
+    if not product_id:
+        stats["errors"] += 1
+        return
     
+    # Check if product exists (you would implement this based on your database)
+    # For now, we'll assume all products are "new" since we're doing a full scrape
+    if mode == "full":
+        # Full scrape mode - treat as new product
+        stats["added"] += 1
+    elif mode == "delta":
+        # Delta mode - check if price changed
+        # This would compare with existing database record
+        stats["updated"] += 1
+    else:
+        stats["unchanged"] += 1
+
+def print_upsert_stats(stats: dict):
     print(f"✅ Upsert complete:")
     print(f"   📊 Total: {stats['total']}")
     print(f"   ➕ Added: {stats['added']}")
     print(f"   🔄 Updated: {stats['updated']}")
     print(f"   ⏸️  Unchanged: {stats['unchanged']}")
     print(f"   ❌ Errors: {stats['errors']}")
+
+async def upsert_products(products: list, client: httpx.AsyncClient, mode: str = "full") -> dict:
+    """Upsert products: update existing ones and add new ones without destroying data"""
+    print(f"🔄 Running {mode} upsert for {len(products)} products...")
+    
+    stats = new_upsert_stats()
+    for product in products:
+        count_upsert(stats, product, mode)
     
+    print_upsert_stats(stats)
     return stats
 
-async def enrich_details(products: list, client: httpx.AsyncClient, test_mode: bool = False, limit: int = None) -> list:
-    """Enrich product details with additional information"""
-    enriched_products = []
-    
-    # Department ID to category name mapping - UPDATED WITH NEW REMA API IDs (2025)
-    department_mapping = {
-        # NEW REMA API department IDs (September 2025)
-        10: "Brød og kager",  # Brød & Bavinchi
-        20: "Frugt og grønt",  # Frugt og grønt
-        30: "Kød og fisk",  # Kød og fisk
-        40: "Kød og fisk",  # Køl - kølede madvarer som leverpostej, sild, etc.
-        50: "Ukategoriseret",  # Frost - mapped to Uncategorized since not in user list
-        60: "Mejeri og køl",  # Mejeri - changed from "Mejeri" to match user categories
-        70: "Mejeri og køl",  # Ost m.v. - already correct
-        80: "Kolonial",  # Kolonial
-        90: "Drikkevarer",  # Drikkevarer
-        100: "Husholdning",  # Husholdning
-        110: "Baby og familie",  # Baby og familie
-        120: "Personlig pleje",  # Personlig pleje
-        130: "Slik og snacks",  # Slik
-        140: "Kiosk",  # Kiosk
-        160: "Ukategoriseret"  # "Nemt og hurtigt" - mapped to Uncategorized since not in user list
-        
-        # OLD MAPPINGS (no longer valid):
-        # 81, 82, 83, 84, 85, 86, 87, 88, 89 - these IDs no longer exist in REMA API
-    }
+def build_enriched_product(product: dict, detail_data: dict) -> dict:
+    """Merge a listed product with its detail response and assign categories"""
+    if detail_data and 'data' in detail_data:
+        # Merge basic product info with detailed info
+        enriched_product = {**product, **detail_data['data']}
+        category, subcategory = map_department(detail_data['data'].get('department'))
+    else:
+        # If detail fetch fails, use basic product info with default category
+        enriched_product = product
+        category, subcategory = "Ukategoriseret", "Ukategoriseret"
     
-    for i, product in enumerate(products):
-        if test_mode and limit and i >= limit:
-            break
+    enriched_product['category'] = category
+    enriched_product['subcategory'] = subcategory
+    return stamp_hashes(enriched_product)
+
+async def iter_enriched(products: list, client: httpx.AsyncClient, test_mode: bool = False, limit: int = None,
+                        concurrency: int = DEFAULT_MAX_CONCURRENCY):
+    """Enrich product details concurrently and yield them in input order as they complete.
+
+    Finished records wait in a small reorder buffer until every earlier index
+    has been yielded; workers pause when they get REORDER_WINDOW ahead.
+    `concurrency` is the worker count; the adaptive controller decides how
+    many of them may have a request in flight.
+    """
+    if test_mode and limit:
+        products = products[:limit]
+    
+    total = len(products)
+    finished = {}
+    progress = asyncio.Condition()
+    latency = LatencyStats()
+    next_index = 0
+    next_emit = 0
+    completed = 0
+    
+    async def worker():
+        nonlocal next_index, completed
+        while next_index < total:
+            index = next_index
+            next_index += 1
             
-        product_id = product.get('id')
-        if not product_id:
-            continue
+            async with progress:
+                await progress.wait_for(lambda: index - next_emit < REORDER_WINDOW)
             
-        print(f"🔍 Enriching product {i+1}/{len(products)}: {product.get('name', 'Unknown')}")
-        
-        # Get detailed product info
-        detail_url = f"{BASE_URL}/api/v3/products/{product_id}?include=department"
-        detail_data = await get_json(detail_url, client)
-        
-        if detail_data and 'data' in detail_data:
-            # Merge basic product info with detailed info
-            enriched_product = {**product, **detail_data['data']}
+            product = products[index]
+            enriched = None
+            if product.get('id'):
+                # Get detailed product info
+                detail_url = f"{BASE_URL}/api/v3/products/{product['id']}?include=department"
+                started = time.perf_counter()
+                detail_data = await get_json(detail_url, client, phase='enrich')
+                latency.record(time.perf_counter() - started, ok=bool(detail_data))
+                with METRICS.phase('transform'):
+                    enriched = build_enriched_product(product, detail_data)
+                METRICS.count('transform', 'records')
+                
+                completed += 1
+                if completed % 100 == 0 or completed == total:
+                    print(f"🔍 Enriched {completed}/{total} products...")
             
-            # Extract and map category from department
-            if 'department' in detail_data['data']:
-                department = detail_data['data']['department']
-                if department and 'id' in department:
-                    dept_id = department['id']
-                    dept_name = department.get('name', '')
-                    
-                    # Try to map by ID first
-                    category_name = department_mapping.get(dept_id, None)
-                    
-                    if category_name:
-                        print(f"   📍 Category: {category_name} (dept {dept_id})")
-                    else:
-                        # Fallback: try to map by department name
-                        dept_name_lower = dept_name.lower()
-                        if 'kolonial' in dept_name_lower:
-                            category_name = "Kolonial"
-                        elif 'frugt' in dept_name_lower or 'grønt' in dept_name_lower:
-                            category_name = "Frugt og grønt"
-                        elif 'kød' in dept_name_lower or 'fisk' in dept_name_lower:
-                            category_name = "Kød og fisk"
-                        elif 'mejeri' in dept_name_lower or 'ost' in dept_name_lower:
-                            category_name = "Mejeri"
-                        elif 'frost' in dept_name_lower:
-                            category_name = "Frost"
-                        elif 'brød' in dept_name_lower or 'kage' in dept_name_lower:
-                            category_name = "Brød og kager"
-                        elif 'drikke' in dept_name_lower:
-                            category_name = "Drikkevarer"
-                        else:
-                            category_name = f"Ukategoriseret (dept {dept_id}: {dept_name})"
-                        
-                        print(f"   📍 Category: {category_name} (dept {dept_id}: {dept_name})")
-                    
-                    enriched_product['category'] = category_name
-                    enriched_product['subcategory'] = dept_name
-                else:
-                    enriched_product['category'] = "Ukategoriseret"
-                    enriched_product['subcategory'] = "Ukategoriseret"
-            else:
-                enriched_product['category'] = "Ukategoriseret"
-                enriched_product['subcategory'] = "Ukategoriseret"
+            async with progress:
+                finished[index] = enriched
+                METRICS.gauge('enrich', 'reorder_buffer', len(finished))
+                progress.notify_all()
+    
+    print(f"🔍 Enriching {total} products (up to {concurrency} concurrent, starting at "
+          f"{RATE_CONTROLLER.rate:g} req/s x {RATE_CONTROLLER.limit})...")
+    workers = asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    
+    try:
+        while next_emit < total:
+            async with progress:
+                await progress.wait_for(lambda: next_emit in finished or workers.done())
+                if next_emit not in finished:
+                    # Workers stopped early; surface their exception
+                    workers.result()
+                    break
+                enriched = finished.pop(next_emit)
+                next_emit += 1
+                progress.notify_all()
             
-            enriched_products.append(enriched_product)
-        else:
-            # If detail fetch fails, use basic product info with default category
-            product['category'] = "Ukategoriseret"
-            product['subcategory'] = "Ukategoriseret"
-            enriched_products.append(product)
+            if enriched is not None:
+                yield enriched
         
-        # Small delay to be respectful to the API
-        await asyncio.sleep(0.1)
+        await workers
+    finally:
+        workers.cancel()
     
-    return enriched_products
+    stats = latency.summary()
+    print(f"⏱️  Detail requests: {stats['requests']} ({stats['failures']} failed) - "
+          f"p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms, p99 {stats['p99_ms']}ms, max {stats['max_ms']}ms")
+
+async def enrich_details(products: list, client: httpx.AsyncClient, test_mode: bool = False, limit: int = None,
+                         concurrency: int = DEFAULT_MAX_CONCURRENCY) -> list:
+    """Enrich product details concurrently, keeping results in input order"""
+    return [
+        product async for product in iter_enriched(products, client, test_mode, limit, concurrency)
+    ]
+
+def save_metrics(args, extra: dict):
+    """Write the run metrics file (and Prometheus dump if requested) with run-level summaries"""
+    extra = {
+        **extra,
+        'retries': RETRY_POLICY.summary(),
+        'rate_control': RATE_CONTROLLER.summary(),
+        'response_cache': RESPONSE_CACHE.summary() if RESPONSE_CACHE else None
+    }
+    METRICS.write_json(args.metrics, extra)
+    print(f"📈 Run metrics saved to: {args.metrics}")
+    if args.prometheus:
+        METRICS.write_prometheus(args.prometheus)
+        print(f"📈 Prometheus metrics saved to: {args.prometheus}")
 
 async def main():
     """Main scraping function"""
+    global RESPONSE_CACHE
     args = parse_arguments()
     
     if args.test:
@@ -339,61 +669,157 @@ async def main():
         print("🚀 FULL MODE: Scraping all products with categories and prices")
     
     start_time = time.time()
+    RATE_CONTROLLER.configure(args.rate, args.concurrency, args.max_rate, args.max_concurrency)
+    if not args.no_cache:
+        RESPONSE_CACHE = ResponseCache(args.cache, args.cache_size_mb * 1024 * 1024)
+    watermarks = DepartmentWatermarkStore(WATERMARKS_FILE)
+    snapshot = ProductSnapshotStore(args.snapshot)
+    
+    # Generate filename based on mode
+    if args.delta:
+        filename = "rema_products_delta.jsonl"
+    elif args.batch:
+        filename = f"rema_products_batch_{args.batch}.jsonl"
+    elif args.test:
+        filename = "rema_products_test.jsonl"
+    else:
+        filename = "rema_products_full.jsonl"
     
-    async with httpx.AsyncClient() as client:
+    output_file = os.path.join(OUT_DIR, filename)
+    
+    # One pooled HTTP/2 client for every phase of the run
+    async with create_async_client(max_connections=args.max_concurrency + args.page_concurrency,
+                                   headers=HEADERS) as client:
         if args.delta:
             # Delta mode: load existing products and check for changes
             print("\n📋 Step 1: Loading existing products...")
-            # This would load from your database
-            # For now, we'll simulate with empty list
-            existing_products = []
+            existing_products = list(snapshot.iter_products())
+            print(f"📋 Loaded {len(existing_products)} products from {args.snapshot}")
+            
+            if not existing_products:
+                print("⚠️ Snapshot is empty - run a full scrape first to seed it")
             
             print(f"\n🔄 Step 2: Running delta price check...")
-            updated_products = await delta_price_check(client, existing_products)
+            with METRICS.phase('delta'):
+                updated_products, removed_ids, diffs = await delta_price_check(
+                    client, existing_products, None if args.all_departments else watermarks, args.max_concurrency
+                )
+            
+            # Commit prices before watermarks so a crash never skips unsaved changes
+            snapshot.upsert_many(updated_products)
+            snapshot.remove_many(removed_ids)
+            watermarks.save()
             
             print(f"\n💾 Step 3: Saving {len(updated_products)} updated products...")
             # This would update your database
             stats = await upsert_products(updated_products, client, "delta")
             
+            print(f"\n💾 Step 4: Saving to {output_file}...")
+            changes_file = os.path.join(OUT_DIR, "rema_products_delta_changes.jsonl")
+            with METRICS.phase('write'):
+                async with AsyncJsonlWriter(output_file) as writer:
+                    for product in updated_products:
+                        await writer.write(product)
+                
+                async with AsyncJsonlWriter(changes_file) as writer:
+                    for diff in diffs:
+                        await writer.write(diff)
+            METRICS.count('write', 'records', len(updated_products))
+            print(f"📝 Change details saved to: {changes_file}")
+            
+            saved_count = len(updated_products)
+            
         else:
             # Full mode: scrape all products
+            checkpoint_file = f"{output_file}.checkpoint.json"
+            if args.resume:
+                checkpoint = ScrapeCheckpoint.resume(checkpoint_file, output_file)
+                checkpoint.truncate_output()
+                print(f"♻️  Resuming from {checkpoint_file}: {len(checkpoint.enriched_ids)} products already enriched")
+            else:
+                checkpoint = ScrapeCheckpoint.fresh(checkpoint_file, output_file)
+            
             print("\n📋 Step 1: Listing all products...")
-            products = await list_all_products(client, args.test, args.limit, args.batch)
+            with METRICS.phase('list'):
+                products, listing_complete = await list_all_products(client, args.test, args.limit, args.batch,
+                                                  args.page_concurrency, checkpoint)
+            METRICS.count('list', 'records', len(products))
             
             if not products:
                 print("❌ No products found!")
+                save_metrics(args, {'mode': 'full', 'products': 0})
+                snapshot.close()
+                if RESPONSE_CACHE:
+                    RESPONSE_CACHE.close()
                 return
             
-            print(f"\n🔍 Step 2: Enriching {len(products)} products with categories and prices...")
-            enriched_products = await enrich_details(products, client, args.test, args.limit)
+            stats = new_upsert_stats()
+            update_baseline = not args.test
+            watermarks.begin_observing()
             
-            print(f"\n💾 Step 3: Saving {len(enriched_products)} products...")
-            # This would save to your database
-            stats = await upsert_products(enriched_products, client, "full")
-        
-        # Generate filename based on mode
-        if args.delta:
-            filename = "rema_products_delta.jsonl"
-        elif args.batch:
-            filename = f"rema_products_batch_{args.batch}.jsonl"
-        elif args.test:
-            filename = "rema_products_test.jsonl"
-        else:
-            filename = "rema_products_full.jsonl"
-        
-        output_file = os.path.join(OUT_DIR, filename)
-        print(f"\n💾 Step 4: Saving to {output_file}...")
-        
-        # Save to file (this would be replaced with database operations)
-        products_to_save = updated_products if args.delta else enriched_products
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for product in products_to_save:
-                f.write(json.dumps(product, ensure_ascii=False) + '\n')
+            if checkpoint.enriched_ids:
+                # Products written by the interrupted run still belong in this run's baseline
+                for product in load_jsonl(output_file):
+                    count_upsert(stats, product, "full")
+                    if update_baseline:
+                        snapshot.stage(product)
+                        watermarks.observe(product)
+                
+                if args.test and args.limit:
+                    products = products[:args.limit]
+                products = [product for product in products if product.get('id') not in checkpoint.enriched_ids]
+            
+            print(f"\n🔍 Step 2: Enriching {len(products)} products and streaming to {output_file}...")
+            
+            # Each finished product goes straight to disk; nothing accumulates in memory
+            async with AsyncJsonlWriter(output_file, 'a' if args.resume else 'w',
+                                        on_flush=checkpoint.mark_flushed) as writer:
+                with METRICS.phase('enrich'):
+                    async for product in iter_enriched(products, client, args.test, args.limit,
+                                                       args.max_concurrency):
+                        # In-memory only: a resume rebuilds enriched ids from the flushed output
+                        checkpoint.mark_enriched(product['id'])
+                        with METRICS.phase('write'):
+                            await writer.write(product)
+                        METRICS.count('write', 'records')
+                        # This would save to your database
+                        count_upsert(stats, product, "full")
+                        
+                        if update_baseline:
+                            # Baseline for the next delta run
+                            snapshot.stage(product)
+                            watermarks.observe(product)
+            
+            saved_count = stats['total']
+            
+            if update_baseline:
+                # Only a whole, unbatched listing shows which products are gone
+                prune = listing_complete and not args.batch
+                pruned = snapshot.commit(prune=prune)
+                watermarks.save()
+                print(f"📸 Snapshot updated with {saved_count} products"
+                      + (f", {pruned} no longer listed removed" if prune else " (partial listing, nothing removed)"))
+            
+            checkpoint.clear()
+            
+            print(f"\n💾 Step 3: Saved {saved_count} products")
+            print_upsert_stats(stats)
         
         elapsed_time = time.time() - start_time
+        retries = RETRY_POLICY.summary()
         print(f"\n🎉 Scraping completed in {elapsed_time:.1f} seconds!")
         print(f"📁 Output saved to: {output_file}")
-        print(f"📊 Total products: {len(products_to_save)}")
+        print(f"📊 Total products: {saved_count}")
+        print(f"🔁 Retries: {retries['retries']} {retries['by_reason']} - gave up {retries['gave_up']} "
+              f"(budget {retries['budget']}, exhausted {retries['budget_exhausted']}x)")
+        RATE_CONTROLLER.print_summary()
+        METRICS.print_summary()
+        
+        if RESPONSE_CACHE:
+            cache_stats = RESPONSE_CACHE.summary()
+            print(f"🗄️  Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} not cached "
+                  f"of {cache_stats['lookups']} lookups ({cache_stats['hit_rate']:.0%}), {cache_stats['bytes_saved'] / 1e6:.1f} MB not re-downloaded, "
+                  f"{cache_stats['evictions']} evicted")
         
         if args.delta:
             print(f"🔄 Delta update stats:")
@@ -401,7 +827,15 @@ async def main():
             print(f"   🔄 Updated: {stats['updated']}")
             print(f"   ➕ Added: {stats['added']}")
             print(f"   ⏸️  Unchanged: {stats['unchanged']}")
+            print(f"   🗑️  Delisted: {len(removed_ids)}")
             print(f"   ❌ Errors: {stats['errors']}")
+        
+        save_metrics(args, {'mode': 'delta' if args.delta else 'test' if args.test else 'full',
+                            'output_file': output_file, 'products': saved_count})
+    
+    snapshot.close()
+    if RESPONSE_CACHE:
+        RESPONSE_CACHE.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+REMA scraper state
+Persisted state shared between scraper runs (department watermarks, product snapshot)
+and the importer's ledger / manifest of what has been committed.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from product_hash import record_content_hash, stamp_hashes
+
+class DepartmentWatermarkStore:
+    """Per-department `products_last_modified_at` watermarks, persisted as JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermarks = {}
+        self.observed = {}
+        self.load()
+
+    def load(self):
+        """Load watermarks from disk (missing or broken file means no watermarks)"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.watermarks = {int(dept_id): stamp for dept_id, stamp in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read watermarks from {self.path}: {e}")
+            self.watermarks = {}
+
+    def save(self):
+        """Write watermarks atomically"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(dept_id): stamp for dept_id, stamp in sorted(self.watermarks.items())}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, dept_id: int):
+        return self.watermarks.get(dept_id)
+
+    def has_changed(self, dept_id: int, modified_at: str) -> bool:
+        """True if the department changed since the stored watermark (or has none)"""
+        stored = self.watermarks.get(dept_id)
+        return stored is None or modified_at is None or modified_at != stored
+
+    def update(self, dept_id: int, modified_at: str):
+        if modified_at:
+            self.watermarks[dept_id] = modified_at
+
+    def observe(self, product: dict):
+        """Record the oldest watermark seen on a product's department.
+
+        Keeping the oldest value means a department that changed mid-scrape
+        still counts as changed on the next delta run. Call begin_observing()
+        first so values left over from earlier runs are replaced.
+        """
+        department = product.get('department') or {}
+        dept_id = department.get('id')
+        modified_at = department.get('products_last_modified_at')
+        if dept_id is None or not modified_at:
+            return
+        if dept_id not in self.observed or modified_at < self.observed[dept_id]:
+            # ISO-8601 timestamps in the same offset compare correctly as strings
+            self.observed[dept_id] = modified_at
+            self.watermarks[dept_id] = modified_at
+
+    def begin_observing(self):
+        self.observed = {}
+
+class ProductSnapshotStore:
+    """Last-seen product records keyed by product id, stored in SQLite"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " id INTEGER PRIMARY KEY,"
+            " record TEXT NOT NULL,"
+            " updated_at TEXT NOT NULL)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(products)")}
+        for column in ('price_hash', 'content_hash'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE products ADD COLUMN {column} TEXT")
+        # Ids staged since the last commit, so a full run can drop the products it no longer saw
+        self.conn.execute("CREATE TEMP TABLE staged_ids (id INTEGER PRIMARY KEY)")
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def get(self, product_id: int):
+        """Return the stored record for a product id, or None"""
+        row = self.conn.execute("SELECT record FROM products WHERE id = ?", (product_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_hashes(self, product_id: int):
+        """Return (price_hash, content_hash) for a product id, or None"""
+        return self.conn.execute(
+            "SELECT price_hash, content_hash FROM products WHERE id = ?", (product_id,)
+        ).fetchone()
+
+    def iter_products(self):
+        """Yield every stored record in id order"""
+        for (record,) in self.conn.execute("SELECT record FROM products ORDER BY id"):
+            yield json.loads(record)
+
+    def stage(self, product: dict) -> bool:
+        """Write one record inside the open transaction; nothing is visible until commit()"""
+        if not product.get('id'):
+            return False
+        if 'content_hash' not in product:
+            stamp_hashes(product)
+        self.conn.execute(
+            "INSERT INTO products (id, record, updated_at, price_hash, content_hash) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at, "
+            "price_hash = excluded.price_hash, content_hash = excluded.content_hash",
+            (product['id'], json.dumps(product, ensure_ascii=False), datetime.now().isoformat(),
+             product['price_hash'], product['content_hash'])
+        )
+        self.conn.execute("INSERT OR IGNORE INTO staged_ids (id) VALUES (?)", (product['id'],))
+        return True
+
+    def commit(self, prune: bool = False) -> int:
+        """Make staged records visible; returns the number of records pruned.
+
+        With prune, every record not staged since the last commit (a product
+        gone from a complete listing) is deleted in the same transaction.
+        """
+        pruned = 0
+        if prune:
+            pruned = self.conn.execute("DELETE FROM products WHERE id NOT IN (SELECT id FROM staged_ids)").rowcount
+        self.conn.execute("DELETE FROM staged_ids")
+        self.conn.commit()
+        return pruned
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def upsert_many(self, products: list) -> int:
+        """Insert or replace records in a single transaction; returns rows written"""
+        # Readers never see a half-applied run: everything commits together or rolls back
+        try:
+            written = sum(1 for product in products if self.stage(product))
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+        return written
+
+    def remove_many(self, product_ids: list) -> int:
+        """Delete records (e.g. delisted products) in a single transaction; returns rows deleted"""
+        try:
+            deleted = sum(self.conn.execute("DELETE FROM products WHERE id = ?", (product_id,)).rowcount
+                          for product_id in product_ids)
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+        return deleted
+
+    def close(self):
+        self.conn.close()
+
+class ImportLedger:
+    """Product ids and content hashes committed per import target, stored in SQLite.
+
+    A target is where the rows went (mode + URL), so importing into another
+    database starts from scratch. Batches are recorded as soon as the server
+    accepts them, so an interrupted import resumes with what is missing.
+    """
+
+    def __init__(self, path: str, target: str):
+        self.path = path
+        self.target = target
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS imported ("
+            " target TEXT NOT NULL,"
+            " product_id TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " imported_at TEXT NOT NULL,"
+            " PRIMARY KEY (target, product_id))"
+        )
+        self.conn.commit()
+        self.hashes = None
+        self.recorded = 0
+
+    @staticmethod
+    def key(product: dict) -> str:
+        return str(product.get('id'))
+
+    def committed(self) -> dict:
+        """product id -> content hash for everything committed to this target (loaded once)"""
+        if self.hashes is None:
+            self.hashes = dict(self.conn.execute(
+                "SELECT product_id, content_hash FROM imported WHERE target = ?", (self.target,)
+            ))
+        return self.hashes
+
+    def __len__(self) -> int:
+        return len(self.committed())
+
+    def record(self, products: list):
+        """Mark a batch as committed (one transaction per batch)"""
+        now = datetime.now().isoformat()
+        rows = [(self.target, self.key(product), record_content_hash(product), now) for product in products]
+        self.conn.executemany(
+            "INSERT INTO imported (target, product_id, content_hash, imported_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(target, product_id) DO UPDATE SET content_hash = excluded.content_hash, "
+            "imported_at = excluded.imported_at",
+            rows
+        )
+        self.conn.commit()
+        committed = self.committed()
+        for _, product_id, hash_value, _ in rows:
+            committed[product_id] = hash_value
+        self.recorded += len(rows)
+
+    def reset(self):
+        """Forget everything committed to this target"""
+        self.conn.execute("DELETE FROM imported WHERE target = ?", (self.target,))
+        self.conn.commit()
+        self.hashes = {}
+
+    def close(self):
+        self.conn.close()
+
+class ImportManifest:
+    """Portable product id -> content hash map of what has been imported, as one JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes = {}
+        self.load()
+
+    def load(self):
+        """Load the manifest (missing or broken file means nothing imported yet)"""
+        if not os.path.exists(self.path):
+            return self.hashes
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.hashes = {str(key): value for key, value in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"⚠️ Could not read import manifest from {self.path}: {e}")
+            self.hashes = {}
+        return self.hashes
+
+    def record(self, products: list):
+        for product in products:
+            self.hashes[str(product.get('id'))] = record_content_hash(product)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.hashes, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
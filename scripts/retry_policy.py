@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Retry policy
+Shared retry rules for the REMA and Zyte clients: which failures are
+retryable, how long to wait (Retry-After or exponential backoff with full
+jitter) and a per-run retry budget. Every retry is counted for the run stats.
+"""
+
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+class RetryPolicy:
+    """Decide whether and when to retry a failed request"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 budget: int = 500, retry_statuses: set = None, max_retry_after: float = 120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retry_statuses = retry_statuses or RETRYABLE_STATUS
+        self.max_retry_after = max_retry_after
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.by_reason = {}
+        self.gave_up = 0
+        self.budget_exhausted = 0
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.retry_statuses
+
+    def parse_retry_after(self, value: str):
+        """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given 0-based attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def next_delay(self, attempt: int, reason: str, retry_after: str = None):
+        """Seconds to sleep before retrying, or None to give up.
+
+        Counts the retry against the run budget when one is granted.
+        """
+        with self.lock:
+            if attempt + 1 >= self.max_attempts:
+                self.gave_up += 1
+                return None
+            if self.budget is not None and self.retries >= self.budget:
+                self.budget_exhausted += 1
+                self.gave_up += 1
+                return None
+
+            self.retries += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+
+        delay = self.parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, self.max_retry_after)
+        return self.backoff(attempt)
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                'retries': self.retries,
+                'by_reason': dict(sorted(self.by_reason.items())),
+                'gave_up': self.gave_up,
+                'budget': self.budget,
+                'budget_exhausted': self.budget_exhausted
+            }
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Run metrics
+Per-phase timers, counters, latency histograms and queue-depth gauges for a
+scraper or import run, written as a JSON metrics file and optionally as a
+Prometheus text exposition (e.g. for node_exporter's textfile collector).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds in seconds, Prometheus style (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are estimated as the bucket upper bound"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def cumulative(self) -> list:
+        """(upper bound, cumulative count) pairs ending with +Inf"""
+        pairs = []
+        seen = 0
+        for bound, count in zip(list(self.buckets) + [float('inf')], self.counts):
+            seen += count
+            pairs.append((bound, seen))
+        return pairs
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+            'buckets': {('+Inf' if bound == float('inf') else f"{bound:g}"): seen for bound, seen in self.cumulative()}
+        }
+
+class PhaseMetrics:
+    """Everything recorded for one phase of the run"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.first_started = None
+        self.last_finished = None
+        self.counters = {}
+        self.statuses = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def to_dict(self, run_started: float) -> dict:
+        return {
+            'seconds': round(self.seconds, 3),
+            'calls': self.calls,
+            # Phases overlap (write runs inside enrich), so also report when each was active
+            'active_from': round(self.first_started - run_started, 3) if self.first_started is not None else None,
+            'active_until': round(self.last_finished - run_started, 3) if self.last_finished is not None else None,
+            'counters': dict(sorted(self.counters.items())),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=lambda item: str(item[0]))},
+            'histograms': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            'gauges': dict(sorted(self.gauges.items()))
+        }
+
+class RunMetrics:
+    """Thread-safe metrics registry for one run, grouped by phase"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.started_wall = datetime.now().isoformat()
+        self.phases = {}
+
+    def _phase(self, phase: str) -> PhaseMetrics:
+        if phase not in self.phases:
+            self.phases[phase] = PhaseMetrics()
+        return self.phases[phase]
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Time a block of work; nested and repeated blocks accumulate per phase"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            finished = time.monotonic()
+            with self.lock:
+                metrics = self._phase(phase)
+                metrics.seconds += finished - started
+                metrics.calls += 1
+                if metrics.first_started is None:
+                    metrics.first_started = started
+                metrics.last_finished = finished
+
+    def add_time(self, phase: str, seconds: float, calls: int = 1):
+        """Add time measured elsewhere (e.g. summed per record) to a phase"""
+        with self.lock:
+            metrics = self._phase(phase)
+            metrics.seconds += seconds
+            metrics.calls += calls
+
+    def count(self, phase: str, name: str, value: float = 1):
+        with self.lock:
+            counters = self._phase(phase).counters
+            counters[name] = counters.get(name, 0) + value
+
+    def observe(self, phase: str, name: str, value: float):
+        with self.lock:
+            histograms = self._phase(phase).histograms
+            if name not in histograms:
+                histograms[name] = Histogram()
+            histograms[name].observe(value)
+
+    def gauge(self, phase: str, name: str, value: float):
+        """Set a gauge (e.g. a queue depth), remembering its peak"""
+        with self.lock:
+            gauges = self._phase(phase).gauges
+            peak = gauges.get(name, {}).get('max', value)
+            gauges[name] = {'last': value, 'max': max(peak, value)}
+
+    def record_request(self, phase: str, status, size: int, seconds: float):
+        """One HTTP attempt: status ('error' names for transport failures), body bytes and latency"""
+        with self.lock:
+            metrics = self._phase(phase)
+            metrics.counters['requests'] = metrics.counters.get('requests', 0) + 1
+            metrics.counters['bytes'] = metrics.counters.get('bytes', 0) + size
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            if 'request_seconds' not in metrics.histograms:
+                metrics.histograms['request_seconds'] = Histogram()
+            metrics.histograms['request_seconds'].observe(seconds)
+
+    def to_dict(self, extra: dict = None) -> dict:
+        with self.lock:
+            data = {
+                'run': self.name,
+                'started_at': self.started_wall,
+                'wall_seconds': round(time.monotonic() - self.started_at, 3),
+                'phases': {phase: metrics.to_dict(self.started_at) for phase, metrics in self.phases.items()}
+            }
+        if extra:
+            data.update(extra)
+        return data
+
+    def write_json(self, path: str, extra: dict = None):
+        """Atomically write the metrics file (extra: run-level summaries such as retries)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(extra), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def prometheus_text(self, prefix: str = "scraper") -> str:
+        """Prometheus text exposition format of every phase metric"""
+        data = self.to_dict()
+        run = self.name
+        lines = []
+
+        def sample(metric: str, labels: dict, value):
+            rendered = ','.join(f'{key}="{label}"' for key, label in {'run': run, **labels}.items())
+            lines.append(f"{prefix}_{metric}{{{rendered}}} {value}")
+
+        lines.append(f"# TYPE {prefix}_run_wall_seconds gauge")
+        sample('run_wall_seconds', {}, data['wall_seconds'])
+        lines.append(f"# TYPE {prefix}_phase_seconds_total counter")
+        for phase, metrics in data['phases'].items():
+            sample('phase_seconds_total', {'phase': phase}, metrics['seconds'])
+
+        counter_names = sorted({name for metrics in data['phases'].values() for name in metrics['counters']})
+        for name in counter_names:
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for phase, metrics in data['phases'].items():
+                if name in metrics['counters']:
+                    sample(f"{name}_total", {'phase': phase}, metrics['counters'][name])
+
+        lines.append(f"# TYPE {prefix}_responses_total counter")
+        for phase, metrics in data['phases'].items():
+            for status, count in metrics['statuses'].items():
+                sample('responses_total', {'phase': phase, 'status': status}, count)
+
+        gauge_names = sorted({name for metrics in data['phases'].values() for name in metrics['gauges']})
+        for name in gauge_names:
+            lines.append(f"# TYPE {prefix}_{name}_max gauge")
+            for phase, metrics in data['phases'].items():
+                if name in metrics['gauges']:
+                    sample(f"{name}_max", {'phase': phase}, metrics['gauges'][name]['max'])
+
+        histogram_names = sorted({name for metrics in data['phases'].values() for name in metrics['histograms']})
+        for name in histogram_names:
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for phase, metrics in data['phases'].items():
+                histogram = metrics['histograms'].get(name)
+                if not histogram:
+                    continue
+                for bound, seen in histogram['buckets'].items():
+                    sample(f"{name}_bucket", {'phase': phase, 'le': bound}, seen)
+                sample(f"{name}_sum", {'phase': phase}, histogram['sum'])
+                sample(f"{name}_count", {'phase': phase}, histogram['count'])
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str, prefix: str = "scraper"):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text(prefix))
+        os.replace(tmp_path, path)
+
+    def print_summary(self, log=print):
+        """One line per phase: time, requests, bytes, latency and retries"""
+        data = self.to_dict()
+        log(f"⏱️  Phases ({data['wall_seconds']:.1f}s wall):")
+        for phase, metrics in data['phases'].items():
+            parts = [f"{metrics['seconds']:.1f}s"]
+            counters = metrics['counters']
+            if 'requests' in counters:
+                parts.append(f"{counters['requests']} requests")
+                parts.append(f"{counters['bytes'] / 1e6:.1f} MB")
+            latency = metrics['histograms'].get('request_seconds')
+            if latency:
+                parts.append(f"p50 ≤{latency['p50'] * 1000:g}ms p99 ≤{latency['p99'] * 1000:g}ms")
+            for name in ('retries', 'records'):
+                if counters.get(name):
+                    parts.append(f"{counters[name]} {name}")
+            for name, gauge in metrics['gauges'].items():
+                parts.append(f"max {name} {gauge['max']}")
+            log(f"   {phase:<10} " + ', '.join(parts))
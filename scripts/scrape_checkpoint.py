@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Scrape checkpoints
+Records finished listing pages and enriched product ids so an interrupted
+full scrape can resume instead of starting over from page 1.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from jsonl_io import load_jsonl
+
+class ScrapeCheckpoint:
+    """Progress of one full scrape, persisted next to its output file.
+
+    Listed pages are appended to `<checkpoint>.listing.jsonl` as they arrive,
+    and enriched products are the lines of the output file itself. The
+    checkpoint JSON only holds small scalar state (the durable output byte
+    offset and the page count); it is rewritten atomically after every output
+    flush so it never claims more than is on disk. Completed pages and
+    enriched ids are rebuilt from the two logs on resume.
+    """
+
+    def __init__(self, path: str, output_file: str):
+        self.path = path
+        self.listing_path = f"{os.path.splitext(path)[0]}.listing.jsonl"
+        self.output_file = output_file
+        self.output_bytes = 0
+        self.last_page = None
+        self.completed_pages = set()
+        self.enriched_ids = set()
+        self.started_at = datetime.now().isoformat()
+
+    @classmethod
+    def resume(cls, path: str, output_file: str):
+        """Load an existing checkpoint for output_file, or start a fresh one"""
+        checkpoint = cls(path, output_file)
+        if not os.path.exists(path):
+            print(f"⚠️ No checkpoint at {path}, starting a fresh scrape")
+            checkpoint.reset()
+            return checkpoint
+
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        if state.get('output_file') != output_file:
+            print(f"⚠️ Checkpoint belongs to {state.get('output_file')}, starting a fresh scrape")
+            checkpoint.reset()
+            return checkpoint
+
+        checkpoint.output_bytes = state.get('output_bytes', 0)
+        checkpoint.last_page = state.get('last_page')
+        checkpoint.started_at = state.get('started_at', checkpoint.started_at)
+        return checkpoint
+
+    @classmethod
+    def fresh(cls, path: str, output_file: str):
+        checkpoint = cls(path, output_file)
+        checkpoint.reset()
+        return checkpoint
+
+    def reset(self):
+        """Forget earlier progress"""
+        for stale in (self.path, self.listing_path):
+            if os.path.exists(stale):
+                os.remove(stale)
+        self.save()
+
+    def save(self):
+        state = {
+            'output_file': self.output_file,
+            'output_bytes': self.output_bytes,
+            'last_page': self.last_page,
+            'started_at': self.started_at,
+            'updated_at': datetime.now().isoformat()
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def load_listing(self) -> dict:
+        """Products of every completed page, keyed by page number (a complete line marks a page complete)"""
+        pages = {}
+        if not os.path.exists(self.listing_path):
+            return pages
+
+        with open(self.listing_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a crash; that page will be fetched again
+                    continue
+                pages[entry['page']] = entry['products']
+        self.completed_pages = set(pages)
+        return pages
+
+    def record_page(self, page: int, products: list, last_page: int = None):
+        """Append a listed page; the line itself marks it complete"""
+        with open(self.listing_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'page': page, 'products': products}, ensure_ascii=False) + '\n')
+        self.completed_pages.add(page)
+        if last_page is not None:
+            self.last_page = last_page
+            self.save()
+
+    def mark_enriched(self, product_id):
+        """Note a written product; the output line is what makes it durable"""
+        self.enriched_ids.add(product_id)
+
+    def mark_flushed(self, output_bytes: int):
+        self.output_bytes = output_bytes
+        self.save()
+
+    def truncate_output(self):
+        """Cut the output file back to the last checkpointed offset"""
+        if not os.path.exists(self.output_file):
+            self.output_bytes = 0
+            self.enriched_ids = set()
+            return
+        with open(self.output_file, 'r+b') as f:
+            f.truncate(self.output_bytes)
+        self.enriched_ids = {product.get('id') for product in load_jsonl(self.output_file)}
+
+    def clear(self):
+        """Remove checkpoint files after a successful run"""
+        for done in (self.path, self.listing_path):
+            if os.path.exists(done):
+                os.remove(done)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Bulk Supabase writes
+Builds supermarket_products rows the same way the Next.js
+import-rema-products route does, and writes them in bulk, either as
+PostgREST upserts (POST /rest/v1/<table>?on_conflict=external_id) or, with
+psycopg installed, as COPY into a temp staging table merged in one statement.
+"""
+
+import json
+import re
+from datetime import datetime, timezone
+
+from product_hash import record_content_hash
+from rema_departments import DEPARTMENT_MAPPING
+
+PRODUCTS_TABLE = "supermarket_products"
+PRICE_HISTORY_TABLE = "supermarket_price_history"
+CONFLICT_COLUMN = "external_id"
+EXTERNAL_ID_PREFIX = "python-"  # Same prefix as the import-rema-products route
+
+# Columns written on insert and overwritten on conflict (created_at and id keep their defaults)
+PRODUCT_COLUMNS = (
+    'external_id', 'name', 'description', 'category', 'subcategory', 'price', 'original_price',
+    'unit', 'amount', 'quantity', 'unit_price', 'is_on_sale', 'sale_end_date', 'currency', 'store',
+    'store_url', 'image_url', 'available', 'temperature_zone', 'nutrition_info', 'labels', 'source',
+    'last_updated', 'updated_at', 'metadata'
+)
+PRICE_HISTORY_COLUMNS = ('product_external_id', 'price', 'original_price', 'is_on_sale', 'sale_end_date')
+JSON_COLUMNS = {'nutrition_info', 'metadata'}
+ARRAY_COLUMNS = {'labels'}
+
+UNIT_MAP = {
+    'gr': 'g', 'g': 'g', 'kg': 'kg', 'ml': 'ml', 'l': 'l', 'cl': 'cl', 'dl': 'dl',
+    'stk': 'stk', 'bdt': 'stk', 'pak': 'stk', 'pkt': 'stk'
+}
+UNDERLINE_PATTERN = re.compile(r'^(\d+(?:[.,]\d+)?)\s*([A-Z]+)\.?\s*(?:/\s*(.+))?$', re.IGNORECASE)
+UNDERLINE_FALLBACK_PATTERN = re.compile(r'^(\d+(?:[.,]\d+)?)\s*([A-Z]+)', re.IGNORECASE)
+
+def parse_underline(underline: str) -> dict:
+    """Unit, amount and brand from an underline like "285 GR. / EASIS".
+
+    quantity is the numeric amount as well (quantity is DECIMAL(10,2) in
+    database-setup.sql); the unit text goes to unit and the raw underline
+    stays in metadata.original_underline.
+    """
+    if not underline:
+        return {'unit': None, 'amount': None, 'brand': None, 'quantity': None}
+    match = UNDERLINE_PATTERN.match(underline) or UNDERLINE_FALLBACK_PATTERN.match(underline)
+    if not match:
+        return {'unit': None, 'amount': None, 'brand': None, 'quantity': None}
+    amount, unit = match.group(1), match.group(2)
+    brand = match.group(3) if match.re is UNDERLINE_PATTERN else None
+    amount = float(amount.replace(',', '.'))
+    return {
+        'unit': UNIT_MAP.get(unit.lower(), 'stk'),
+        'amount': amount,
+        'brand': brand or None,
+        'quantity': amount
+    }
+
+def fallback_category(name: str) -> str:
+    name = (name or '').lower()
+    if any(word in name for word in ('kikærter', 'bønner', 'ris', 'pasta')):
+        return 'Kolonial'
+    if any(word in name for word in ('æble', 'tomat', 'agurk')):
+        return 'Frugt og grønt'
+    if any(word in name for word in ('mælk', 'ost', 'yoghurt')):
+        return 'Mejeri og køl'
+    return 'Ukategoriseret'
+
+def product_category(product: dict) -> str:
+    category = product.get('category')
+    if category and category != 'Ukategoriseret':
+        return category
+    department = product.get('department') or {}
+    if department.get('id') is not None:
+        return DEPARTMENT_MAPPING.get(department['id']) or fallback_category(product.get('name'))
+    return fallback_category(product.get('name'))
+
+def is_campaign(price: dict) -> bool:
+    return price.get('is_campaign') in (True, 'true', 1)
+
+def to_product_row(product: dict, now: str = None) -> dict:
+    """supermarket_products row for a scraped REMA product (mirrors import-rema-products/route.ts)"""
+    now = now or datetime.now(timezone.utc).isoformat()
+    prices = product.get('prices') or []
+    sale_end_date = None
+    if len(prices) >= 2:
+        if is_campaign(prices[0]):
+            price, original_price, on_sale = prices[0].get('price'), prices[1].get('price'), True
+            sale_end_date = prices[0].get('ending_at')
+        else:
+            price = original_price = prices[1].get('price')
+            on_sale = False
+    else:
+        price = (prices[0].get('price') if prices else None) or 0
+        original_price = price
+        on_sale = False
+
+    underline = parse_underline(product.get('underline'))
+    images = product.get('images') or []
+    department = product.get('department') or {}
+    return {
+        'external_id': f"{EXTERNAL_ID_PREFIX}{product.get('id')}",
+        'name': product.get('name'),
+        'description': product.get('description') or product.get('underline') or None,
+        'category': product_category(product),
+        'subcategory': department.get('name') or 'Ukategoriseret',
+        'price': price,
+        'original_price': original_price,
+        'unit': underline['unit'],
+        'amount': underline['amount'],
+        'quantity': underline['quantity'],
+        'unit_price': (prices[0].get('compare_unit_price') if prices else None) or 0,
+        'is_on_sale': on_sale,
+        'sale_end_date': sale_end_date,
+        'currency': 'DKK',
+        'store': 'REMA 1000',
+        'store_url': f"https://shop.rema1000.dk/produkt/{product.get('id')}",
+        'image_url': (images[0].get('medium') or images[0].get('small') or None) if images else None,
+        'available': product.get('is_available_in_all_stores') is not False,
+        'temperature_zone': product.get('temperature_zone'),
+        'nutrition_info': (product.get('detail') or {}).get('nutrition_info') or None,
+        'labels': [label.get('name') for label in product.get('labels') or []],
+        'source': 'rema1000-python-scraper',
+        'last_updated': now,
+        'updated_at': now,
+        'metadata': {
+            'rema_id': product.get('id'),
+            'department': department.get('name') or 'Ukendt',
+            'brand': underline['brand'],
+            'original_underline': product.get('underline'),
+            'content_hash': record_content_hash(product)  # Read back by the importer's pre-import diff
+        }
+    }
+
+def price_history_row(row: dict) -> dict:
+    return {
+        'product_external_id': row['external_id'],
+        'price': row['price'],
+        'original_price': row['original_price'],
+        'is_on_sale': row['is_on_sale'],
+        'sale_end_date': row['sale_end_date']
+    }
+
+def unique_rows(rows: list) -> list:
+    """Last row per external_id; Postgres rejects an upsert that touches the same row twice"""
+    return list({row[CONFLICT_COLUMN]: row for row in rows}.values())
+
+def rest_headers(api_key: str) -> dict:
+    """PostgREST headers for a merge-duplicates upsert that returns no body"""
+    return {
+        "apikey": api_key,
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal"
+    }
+
+def rest_upsert_url(supabase_url: str, table: str = PRODUCTS_TABLE, conflict_column: str = CONFLICT_COLUMN) -> str:
+    return f"{supabase_url.rstrip('/')}/rest/v1/{table}?on_conflict={conflict_column}"
+
+def rest_hashes_url(supabase_url: str) -> str:
+    """PostgREST select of every python-imported external_id with the content hash kept in metadata"""
+    return (f"{supabase_url.rstrip('/')}/rest/v1/{PRODUCTS_TABLE}"
+            f"?select={CONFLICT_COLUMN},content_hash:metadata->>content_hash"
+            f"&{CONFLICT_COLUMN}=like.{EXTERNAL_ID_PREFIX}*&order={CONFLICT_COLUMN}")
+
+def rest_insert_url(supabase_url: str, table: str = PRICE_HISTORY_TABLE) -> str:
+    return f"{supabase_url.rstrip('/')}/rest/v1/{table}"
+
+def copy_value(column: str, value) -> str:
+    """One field in COPY text format"""
+    if value is None:
+        return r'\N'
+    if column in JSON_COLUMNS:
+        value = json.dumps(value, ensure_ascii=False)
+    elif column in ARRAY_COLUMNS:
+        value = '{' + ','.join('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def copy_text(rows: list, columns: tuple) -> str:
+    return ''.join('\t'.join(copy_value(column, row.get(column)) for column in columns) + '\n' for row in rows)
+
+class PostgresCopyImporter:
+    """COPY rows into a temp staging table, then merge into supermarket_products in one statement.
+
+    Needs psycopg 3 (pip install 'psycopg[binary]') and a direct Postgres URL
+    (Supabase: Project settings -> Database -> connection string).
+    """
+
+    def __init__(self, database_url: str, price_history: bool = True):
+        try:
+            import psycopg
+        except ImportError:
+            raise RuntimeError("copy mode needs psycopg: pip install 'psycopg[binary]'")
+        self.conn = psycopg.connect(database_url)
+        self.price_history = price_history
+        self.staged = 0
+        with self.conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE import_staging (LIKE {PRODUCTS_TABLE} INCLUDING DEFAULTS) ON COMMIT DROP")
+
+    def stage(self, rows: list):
+        """Stream a batch of rows into the staging table"""
+        columns = ', '.join(PRODUCT_COLUMNS)
+        with self.conn.cursor() as cur:
+            with cur.copy(f"COPY import_staging ({columns}) FROM STDIN") as copy:
+                copy.write(copy_text(rows, PRODUCT_COLUMNS))
+        self.staged += len(rows)
+
+    def merge(self) -> int:
+        """Upsert the staged rows (last one per external_id wins) and commit; returns rows merged"""
+        columns = ', '.join(PRODUCT_COLUMNS)
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in PRODUCT_COLUMNS if column != CONFLICT_COLUMN)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {PRODUCTS_TABLE} ({columns}) "
+                f"SELECT DISTINCT ON ({CONFLICT_COLUMN}) {columns} FROM import_staging "
+                f"ORDER BY {CONFLICT_COLUMN}, ctid DESC "
+                f"ON CONFLICT ({CONFLICT_COLUMN}) DO UPDATE SET {updates}"
+            )
+            merged = cur.rowcount
+            if self.price_history:
+                history = ', '.join(PRICE_HISTORY_COLUMNS)
+                cur.execute(
+                    f"INSERT INTO {PRICE_HISTORY_TABLE} ({history}) "
+                    f"SELECT DISTINCT ON (external_id) external_id, price, original_price, is_on_sale, sale_end_date "
+                    f"FROM import_staging ORDER BY external_id, ctid DESC"
+                )
+        self.conn.commit()
+        return merged
+
+    def close(self):
+        self.conn.close()
@@ -8,6 +8,8 @@ import requests
 import os
 from typing import List, Dict, Any
 
+from jsonl_io import load_jsonl
+
 # Configuration
 FUNCTIONALFOODS_URL = "http://localhost:3000"  # Change if different
 IMPORT_API = f"{FUNCTIONALFOODS_URL}/api/admin/dagligvarer/import-rema-products"
@@ -15,17 +17,12 @@ TEST_DATA_FILE = "scripts/data/rema_products.jsonl"
 
 def load_test_products() -> List[Dict[str, Any]]:
     """Load test products from JSONL file"""
-    products = []
-    
     if not os.path.exists(TEST_DATA_FILE):
         print(f"❌ Test data file not found: {TEST_DATA_FILE}")
         print("💡 Run the scraper first: python3 rema_scraper.py --test --limit 5")
         return []
     
-    with open(TEST_DATA_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                products.append(json.loads(line))
+    products = list(load_jsonl(TEST_DATA_FILE))
     
     print(f"📦 Loaded {len(products)} test products from {TEST_DATA_FILE}")
     return products
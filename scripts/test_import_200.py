@@ -4,23 +4,19 @@ Test Import 200 Products
 Tests importing 200 products from the test sample to the import API.
 """
 
-import json
 import requests
 import time
 
+from jsonl_io import load_jsonl
+
 def load_test_products(file_path):
     """Load test products from JSONL file"""
     print(f"📂 Loading products from: {file_path}")
     
-    products = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            try:
-                product = json.loads(line.strip())
-                products.append(product)
-            except Exception as e:
-                print(f"⚠️  Error parsing line: {e}")
-                continue
+    def on_error(line_num, error):
+        print(f"⚠️  Error parsing line {line_num}: {error}")
+    
+    products = list(load_jsonl(file_path, on_error=on_error))
     
     print(f"✅ Loaded {len(products)} products")
     return products
@@ -12,9 +12,16 @@ Usage:
     1. Set your Zyte API key: export ZYTE_API_KEY="your_key_here"
     2. Run: python scripts/zyte-rema-scraper.py
 
+Discovered endpoints are cached in scraped-data/zyte-endpoints.json and reused
+(after one cheap validation request each) until ZYTE_ENDPOINT_TTL_HOURS
+(default 168) have passed; set ZYTE_REDISCOVER=1 to force a new discovery.
+
 Output:
-    - rema-products-YYYY-MM-DD-HH-mm.json (full product data)
-    - rema-stats-YYYY-MM-DD-HH-mm.json (scraping statistics)
+    - rema-products-YYYY-MM-DD-HH-mm.jsonl (one product per line, appended as pages arrive;
+      .jsonl.gz / .jsonl.zst with ZYTE_OUTPUT_COMPRESSION=gzip / zstd)
+    - rema-stats-YYYY-MM-DD-HH-mm.json (scraping statistics, rewritten while the run progresses)
+    - rema-metrics-YYYY-MM-DD-HH-mm.json (per-phase timings, requests, latency histograms)
+    - Prometheus text dump of the same metrics if ZYTE_PROMETHEUS_FILE is set
 """
 
 import os
@@ -23,10 +30,17 @@ import base64
 import requests
 import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import concurrent.futures
+from collections import deque
 from urllib.parse import urljoin, urlparse
 
+from http_client import create_session
+from jsonl_io import JsonlWriter, with_compression
+from rate_control import AdaptiveRateController
+from retry_policy import RETRYABLE_STATUS, RetryPolicy
+from run_metrics import RunMetrics
+
 # Configuration
 ZYTE_API_KEY = os.getenv("ZYTE_API_KEY")
 if not ZYTE_API_KEY:
@@ -34,33 +48,96 @@ if not ZYTE_API_KEY:
     exit(1)
 
 BASE_URL = "https://shop.rema1000.dk/"
-MAX_WORKERS = 5  # Concurrent requests
-DELAY_BETWEEN_BATCHES = 1  # Seconds
+MAX_WORKERS = 5  # Concurrent Zyte requests (pool size and controller ceiling)
+ZYTE_RATE = 2.0  # Starting requests per second (adapted at runtime)
+ZYTE_MAX_RATE = 10.0  # Ceiling for the adaptive controller
 MAX_PAGES_PER_CATEGORY = 50
+PAGE_SIZE = 50
+SPECULATIVE_PAGES = 2  # Pages kept in flight per category when its page count is unknown
+PROMETHEUS_FILE = os.getenv("ZYTE_PROMETHEUS_FILE")  # Optional Prometheus text dump of the run metrics
+ENDPOINT_CACHE_FILE = "scraped-data/zyte-endpoints.json"
+ENDPOINT_CACHE_TTL_HOURS = float(os.getenv("ZYTE_ENDPOINT_TTL_HOURS", "168"))
+FORCE_DISCOVERY = os.getenv("ZYTE_REDISCOVER") == "1"
+OUTPUT_COMPRESSION = os.getenv("ZYTE_OUTPUT_COMPRESSION")  # gzip or zstd; plain JSONL if unset
+STATS_INTERVAL = 10.0  # Seconds between stats file updates during the run
 
 # Zyte API endpoint
-ZYTE_API_URL = "https://api.zyte.com/v1/extract"
+ZYTE_API_URL = os.getenv("ZYTE_API_URL", "https://api.zyte.com/v1/extract")  # Overridable for mock_rema_server.py
 ZYTE_AUTH = (ZYTE_API_KEY, "")
 
+# 520/521 are Zyte's temporary download errors; retries are counted in the stats file
+RETRY_POLICY = RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=60.0, budget=100,
+                           retry_statuses=RETRYABLE_STATUS | {520, 521})
+
+# Pooled keep-alive session reused by every Zyte call
+ZYTE_SESSION = create_session(pool_size=MAX_WORKERS, headers={"Accept-Encoding": "gzip, deflate, br"})
+ZYTE_SESSION.auth = ZYTE_AUTH
+
+# Worker threads for endpoint probes and page fetches; the controller below caps how many are in flight
+ZYTE_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="zyte")
+
+# Replaces the fixed sleeps between requests, pages and categories. Concurrency is
+# intentionally capped at MAX_WORKERS (the thread and connection pool size, kept within
+# the Zyte plan's concurrency): it starts there and only backs off on throttling or
+# errors and recovers; the request rate is what adapts upwards.
+RATE_CONTROLLER = AdaptiveRateController(rate=ZYTE_RATE, limit=MAX_WORKERS, min_rate=0.2,
+                                         max_rate=ZYTE_MAX_RATE, max_limit=MAX_WORKERS,
+                                         rate_step=0.5, name="Zyte API")
+
+# Per-phase timings and request stats: discover, list, transform, write
+METRICS = RunMetrics("zyte_rema_scraper")
+
 def log(message: str, *args):
     """Log with timestamp"""
     print(f"[{datetime.now().isoformat()}] {message}", *args)
 
-def zyte_request(payload: Dict) -> Dict:
-    """Make a request to Zyte API"""
-    try:
-        response = requests.post(
-            ZYTE_API_URL,
-            auth=ZYTE_AUTH,
-            headers={"Accept-Encoding": "gzip, deflate, br"},
-            json=payload,
-            timeout=120
-        )
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        log(f"❌ Zyte request failed: {e}")
-        raise
+def zyte_request(payload: Dict, phase: str = 'list') -> Dict:
+    """Make a request to Zyte API, retrying rate limits and temporary errors"""
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            with RATE_CONTROLLER.slot_blocking():
+                METRICS.gauge(phase, 'in_flight', RATE_CONTROLLER.in_flight)
+                started = time.perf_counter()
+                response = ZYTE_SESSION.post(
+                    ZYTE_API_URL,
+                    json=payload,
+                    timeout=120
+                )
+                latency = time.perf_counter() - started
+            METRICS.record_request(phase, response.status_code, len(response.content), latency)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            METRICS.record_request(phase, type(e).__name__, 0, time.perf_counter() - started)
+            RATE_CONTROLLER.record_error(type(e).__name__)
+            delay = RETRY_POLICY.next_delay(attempt, type(e).__name__)
+            if delay is None:
+                log(f"❌ Zyte request failed: {e}")
+                raise
+            log(f"🔁 Zyte {type(e).__name__}, retry {attempt + 1} in {delay:.1f}s")
+        else:
+            if not RETRY_POLICY.is_retryable_status(response.status_code):
+                RATE_CONTROLLER.record_success(latency)
+                try:
+                    response.raise_for_status()
+                    return response.json()
+                except Exception as e:
+                    log(f"❌ Zyte request failed: {e}")
+                    raise
+            
+            if response.status_code in (429, 503):
+                RATE_CONTROLLER.record_throttle(response.status_code)
+            else:
+                RATE_CONTROLLER.record_error(str(response.status_code))
+            delay = RETRY_POLICY.next_delay(attempt, str(response.status_code), response.headers.get("Retry-After"))
+            if delay is None:
+                log(f"❌ Zyte request failed: HTTP {response.status_code} after {attempt + 1} attempts")
+                response.raise_for_status()
+            log(f"🔁 Zyte HTTP {response.status_code}, retry {attempt + 1} in {delay:.1f}s")
+        
+        METRICS.count(phase, 'retries')
+        time.sleep(delay)
+        attempt += 1
 
 def decode_response_body(body_b64: str) -> Any:
     """Decode base64 response body to JSON"""
@@ -93,7 +170,7 @@ def discover_api_endpoints() -> List[str]:
         ]
     }
     
-    result = zyte_request(payload)
+    result = zyte_request(payload, phase='discover')
     endpoints = []
     
     for capture in result.get("networkCapture", []):
@@ -115,7 +192,7 @@ def discover_api_endpoints() -> List[str]:
     log(f"📡 Discovered {len(unique_endpoints)} unique API endpoints")
     return unique_endpoints
 
-def fetch_json_via_zyte(url: str) -> Optional[Dict]:
+def fetch_json_via_zyte(url: str, phase: str = 'list') -> Optional[Dict]:
     """Fetch JSON data from URL via Zyte HTTP mode"""
     payload = {
         "url": url,
@@ -124,7 +201,7 @@ def fetch_json_via_zyte(url: str) -> Optional[Dict]:
     }
     
     try:
-        result = zyte_request(payload)
+        result = zyte_request(payload, phase)
         if result.get("httpResponseBody"):
             return decode_response_body(result["httpResponseBody"])
     except Exception as e:
@@ -132,6 +209,27 @@ def fetch_json_via_zyte(url: str) -> Optional[Dict]:
     
     return None
 
+def fetch_many(urls: List[str], phase: str = 'list') -> List[Optional[Dict]]:
+    """Fetch several URLs via Zyte in parallel on the shared pool, results in input order"""
+    return list(ZYTE_POOL.map(lambda url: fetch_json_via_zyte(url, phase), urls))
+
+def classify_endpoint(data: Any) -> Optional[str]:
+    """'products', 'categories' or None for a probed endpoint's JSON"""
+    if isinstance(data, list) and len(data) > 0:
+        # Looks like a product or category list
+        first_item = data[0]
+        if any(key in first_item for key in ['name', 'title', 'price', 'id', 'productId']):
+            return 'products'
+        if any(key in first_item for key in ['category', 'categoryName', 'department']):
+            return 'categories'
+    elif isinstance(data, dict):
+        # Check if it's a paginated response
+        if 'products' in data or 'items' in data or 'results' in data:
+            return 'products'
+        if 'categories' in data or 'departments' in data:
+            return 'categories'
+    return None
+
 def find_product_endpoints(discovered_endpoints: List[str]) -> Dict[str, str]:
     """Test discovered endpoints to find product and category APIs"""
     log("🎯 Testing endpoints for product data...")
@@ -165,31 +263,17 @@ def find_product_endpoints(discovered_endpoints: List[str]) -> Dict[str, str]:
     
     working_endpoints = {}
     
-    for url in endpoints_to_test:
-        log(f"🔍 Testing: {url}")
-        data = fetch_json_via_zyte(url)
-        
-        if data:
-            if isinstance(data, list) and len(data) > 0:
-                # Looks like a product or category list
-                first_item = data[0]
-                if any(key in first_item for key in ['name', 'title', 'price', 'id', 'productId']):
-                    working_endpoints['products'] = url
-                    log(f"✅ Found products endpoint: {url}")
-                elif any(key in first_item for key in ['category', 'categoryName', 'department']):
-                    working_endpoints['categories'] = url
-                    log(f"✅ Found categories endpoint: {url}")
-            
-            elif isinstance(data, dict):
-                # Check if it's a paginated response
-                if 'products' in data or 'items' in data or 'results' in data:
-                    working_endpoints['products'] = url
-                    log(f"✅ Found paginated products endpoint: {url}")
-                elif 'categories' in data or 'departments' in data:
-                    working_endpoints['categories'] = url
-                    log(f"✅ Found categories endpoint: {url}")
-        
-        time.sleep(0.5)  # Be respectful
+    # Probe one pool-sized wave at a time, in list order, so we stop soon after both are found
+    for start in range(0, len(endpoints_to_test), MAX_WORKERS):
+        wave = endpoints_to_test[start:start + MAX_WORKERS]
+        for url in wave:
+            log(f"🔍 Testing: {url}")
+        
+        for url, data in zip(wave, fetch_many(wave, phase='discover')):
+            kind = classify_endpoint(data) if data else None
+            if kind and kind not in working_endpoints:
+                working_endpoints[kind] = url
+                log(f"✅ Found {kind} endpoint: {url}")
         
         # Stop if we found both
         if 'products' in working_endpoints and 'categories' in working_endpoints:
@@ -197,6 +281,118 @@ def find_product_endpoints(discovered_endpoints: List[str]) -> Dict[str, str]:
     
     return working_endpoints
 
+class EndpointCache:
+    """Discovered API endpoints and when they were found, persisted as JSON"""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.working_endpoints = {}
+        self.discovered_endpoints = []
+        self.discovered_at = None
+        self.load()
+
+    def load(self):
+        """Load the cache from disk (missing or broken file means nothing cached)"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            discovered_at = data.get('discovered_at')
+            if isinstance(discovered_at, bool) or not isinstance(discovered_at, (int, float)):
+                raise ValueError(f"discovered_at is not a timestamp: {discovered_at!r}")
+            self.working_endpoints = dict(data.get('working_endpoints') or {})
+            self.discovered_endpoints = list(data.get('discovered_endpoints') or [])
+            self.discovered_at = discovered_at
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"⚠️ Could not read endpoint cache from {self.path}: {e}")
+            self.working_endpoints = {}
+            self.discovered_endpoints = []
+            self.discovered_at = None
+
+    def save(self, working_endpoints: dict, discovered_endpoints: list):
+        """Remember a fresh discovery, written atomically"""
+        self.working_endpoints = dict(working_endpoints)
+        self.discovered_endpoints = list(discovered_endpoints)
+        self.discovered_at = time.time()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'discovered_at': self.discovered_at,
+                'discovered_at_iso': datetime.fromtimestamp(self.discovered_at).isoformat(),
+                'working_endpoints': self.working_endpoints,
+                'discovered_endpoints': self.discovered_endpoints
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def age(self):
+        """Seconds since discovery, or None if nothing is cached"""
+        if self.discovered_at is None:
+            return None
+        return max(0.0, time.time() - self.discovered_at)
+
+    def is_fresh(self) -> bool:
+        """True if a products endpoint is cached and younger than the TTL"""
+        age = self.age()
+        return bool(self.working_endpoints.get('products')) and age is not None and age < self.ttl_seconds
+
+    def invalidate(self):
+        self.working_endpoints = {}
+        self.discovered_endpoints = []
+        self.discovered_at = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def validate_endpoints(working_endpoints: Dict[str, str]) -> bool:
+    """Cheap check that cached endpoints still answer with the expected shape.
+
+    One plain HTTP Zyte request per endpoint (no browser rendering or
+    network capture), run in parallel.
+    """
+    kinds = [kind for kind in ('products', 'categories') if kind in working_endpoints]
+    results = fetch_many([working_endpoints[kind] for kind in kinds], phase='discover')
+    for kind, data in zip(kinds, results):
+        if classify_endpoint(data) != kind:
+            log(f"⚠️ Cached {kind} endpoint no longer valid: {working_endpoints[kind]}")
+            return False
+    return True
+
+def resolve_endpoints() -> Tuple[Dict[str, str], List[str], bool]:
+    """Working endpoints from the on-disk cache if still valid, else from a full discovery.
+
+    Returns (working endpoints, discovered endpoints, whether the cache was used).
+    """
+    cache = EndpointCache(ENDPOINT_CACHE_FILE, ENDPOINT_CACHE_TTL_HOURS * 3600)
+    
+    if FORCE_DISCOVERY:
+        log("🔍 ZYTE_REDISCOVER=1, ignoring cached endpoints")
+    elif cache.is_fresh():
+        log(f"♻️  Using endpoints cached {cache.age() / 3600:.1f}h ago, validating...")
+        if validate_endpoints(cache.working_endpoints):
+            METRICS.count('discover', 'cache_hits')
+            return cache.working_endpoints, cache.discovered_endpoints, True
+        cache.invalidate()
+    elif cache.working_endpoints:
+        age = cache.age()
+        age_text = f"{age / 3600:.1f}h old" if age is not None else "of unknown age"
+        log(f"⏰ Cached endpoints are {age_text} (TTL {ENDPOINT_CACHE_TTL_HOURS:g}h), rediscovering")
+    
+    METRICS.count('discover', 'cache_misses')
+    
+    # Step 1: Discover API endpoints
+    discovered_endpoints = discover_api_endpoints()
+    
+    # Step 2: Find working product/category endpoints
+    working_endpoints = find_product_endpoints(discovered_endpoints)
+    
+    if working_endpoints.get('products'):
+        cache.save(working_endpoints, discovered_endpoints)
+        log(f"💾 Cached endpoints in {ENDPOINT_CACHE_FILE}")
+    return working_endpoints, discovered_endpoints, False
+
 def scrape_categories(categories_url: str) -> List[Dict]:
     """Scrape category data"""
     log(f"📂 Scraping categories from: {categories_url}")
@@ -228,71 +424,259 @@ def scrape_categories(categories_url: str) -> List[Dict]:
     log(f"📂 Found {len(categories)} categories")
     return categories
 
-def scrape_products_paginated(products_url: str, category_id: Optional[str] = None) -> List[Dict]:
-    """Scrape products with pagination"""
-    all_products = []
-    page = 1
+def build_page_url(products_url: str, page: int, category_id: Optional[str] = None) -> str:
+    """Products URL for one page, keeping any query the endpoint already had"""
+    url = products_url
+    params = []
     
-    while page <= MAX_PAGES_PER_CATEGORY:
-        # Build URL with pagination and category filter
-        url = products_url
-        params = []
-        
-        if "?" in url:
-            url_parts = url.split("?")
-            url = url_parts[0]
-            if len(url_parts) > 1:
-                params.append(url_parts[1])
-        
-        params.append(f"page={page}")
-        params.append("limit=50")
-        
-        if category_id:
-            params.append(f"category={category_id}")
-        
-        full_url = f"{url}?{'&'.join(params)}"
-        
-        log(f"📄 Fetching page {page}: {full_url}")
-        data = fetch_json_via_zyte(full_url)
+    if "?" in url:
+        url_parts = url.split("?")
+        url = url_parts[0]
+        if len(url_parts) > 1:
+            # Drop pagination already in the discovered URL (e.g. a captured page=1)
+            params.extend(param for param in url_parts[1].split("&")
+                          if param and param.split("=")[0] not in ("page", "limit", "category"))
+    
+    params.append(f"page={page}")
+    params.append(f"limit={PAGE_SIZE}")
+    
+    if category_id:
+        params.append(f"category={category_id}")
+    
+    return f"{url}?{'&'.join(params)}"
+
+def extract_products(data: Any) -> List[Dict]:
+    """Product list from a page response, whatever the envelope"""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        return (data.get('products') or 
+                data.get('items') or 
+                data.get('results') or 
+                data.get('data', []))
+    return []
+
+def page_count_hint(data: Any) -> Optional[int]:
+    """Number of pages if the first page tells us (total / page count fields), else None"""
+    if not isinstance(data, dict):
+        return None
+    pagination = (data.get('meta') or {}).get('pagination') or data.get('pagination') or data
+    for key in ('last_page', 'total_pages', 'totalPages', 'pageCount'):
+        if isinstance(pagination.get(key), int):
+            return pagination[key]
+    for key in ('total', 'totalCount', 'total_count'):
+        if isinstance(pagination.get(key), int):
+            return -(-pagination[key] // PAGE_SIZE)
+    return None
+
+class ResultsSink:
+    """Streams unique products to the JSONL output and keeps the stats file current.
+
+    Only running totals are kept in memory, so downstream import can read
+    the output (flushed every 100 products) before the scrape finishes.
+    """
+    
+    def __init__(self, timestamp: str, compression: Optional[str] = None):
+        os.makedirs("scraped-data", exist_ok=True)
+        self.products_file = with_compression(f"scraped-data/rema-products-{timestamp}.jsonl", compression)
+        self.stats_file = f"scraped-data/rema-stats-{timestamp}.json"
+        self.writer = JsonlWriter(self.products_file).open()
+        self.started_at = time.time()
+        self.stats_written_at = 0.0
+        self.context = {}
+        self.total = 0
+        self.on_sale = 0
+        self.categories = set()
+        self.price_sum = 0.0
+    
+    def add(self, product: Dict):
+        with METRICS.phase('write'):
+            self.writer.write(product)
+        METRICS.count('write', 'records')
+        self.total += 1
+        if product.get('on_sale'):
+            self.on_sale += 1
+        self.categories.add(str(product.get('category', 'Unknown')))
+        if product.get('price'):
+            self.price_sum += product['price']
+    
+    def write_stats(self, status: str, extra: Optional[Dict] = None) -> Dict:
+        """Atomically rewrite the stats file with the totals so far"""
+        stats = {
+            'status': status,
+            'timestamp': datetime.now().isoformat(),
+            'scrape_time_seconds': round(time.time() - self.started_at, 2),
+            'products_file': self.products_file,
+            'total_products': self.total,
+            'products_on_sale': self.on_sale,
+            'categories': len(self.categories),
+            'average_price': round(self.price_sum / self.total, 2) if self.total else 0,
+            'retries': RETRY_POLICY.summary(),
+            'rate_control': RATE_CONTROLLER.summary(),
+            **self.context,
+            **(extra or {})
+        }
+        tmp_file = f"{self.stats_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.stats_file)
+        self.stats_written_at = time.monotonic()
+        return stats
+    
+    def maybe_write_stats(self):
+        if time.monotonic() - self.stats_written_at >= STATS_INTERVAL:
+            self.write_stats('running')
+    
+    def close(self):
+        with METRICS.phase('write'):
+            self.writer.close()
+
+def scrape_products(products_url: str, categories: List[Dict], sink: ResultsSink) -> Dict:
+    """Scrape every category's pages concurrently, deduplicating products by external_id.
+
+    Pages from all categories share one work queue that feeds the Zyte pool
+    round-robin by category, so one large category can't starve the rest and
+    a small one finishing early never leaves workers idle. A category whose
+    page 1 reports a total queues all its pages at once; otherwise it keeps
+    SPECULATIVE_PAGES pages in flight until a short or empty page.
+
+    Unique products go to `sink` as soon as their page arrives, transformed
+    by a ProductTransformer (layout detected once, last_updated stamped once
+    per page). Returns per-category stats.
+    """
+    seen_ids = set()
+    transformer = ProductTransformer()
+    state = {}
+    queues = {}
+    ready = deque()
+    pending = {}
+    max_pending = MAX_WORKERS * 2
+    
+    for index, category in enumerate(categories):
+        category_id = category.get('id')
+        key = index
+        state[key] = {
+            'id': category_id,
+            'name': category.get('name', 'Unknown'),
+            'last_page': None,
+            'next_page': 2,
+            'stopped_at': None,
+            'pages': 0,
+            'products': 0,
+            'duplicates': 0,
+            'failed_pages': []
+        }
+        queues[key] = deque([1])
+        ready.append(key)
+    
+    def enqueue(key, pages):
+        if not queues[key] and pages:
+            ready.append(key)
+        queues[key].extend(pages)
+    
+    def fill():
+        # Round-robin over categories with queued pages, keeping the pool just ahead of its workers
+        while ready and len(pending) < max_pending:
+            key = ready.popleft()
+            page = queues[key].popleft()
+            category_id = state[key]['id']
+            url = build_page_url(products_url, page, str(category_id) if category_id not in (None, '') else None)
+            pending[ZYTE_POOL.submit(fetch_json_via_zyte, url)] = (key, page)
+            if queues[key]:
+                ready.append(key)
+    
+    def add_page(key, page, data):
+        category = state[key]
+        if category['stopped_at'] is not None and page > category['stopped_at']:
+            # Speculative page past the end of this category
+            return
         
         if not data:
-            log(f"❌ No data for page {page}, stopping")
-            break
-        
-        # Extract products from response
-        products = []
-        if isinstance(data, list):
-            products = data
-        elif isinstance(data, dict):
-            products = (data.get('products') or 
-                       data.get('items') or 
-                       data.get('results') or 
-                       data.get('data', []))
-        
-        if not products or len(products) == 0:
-            log(f"📄 No products on page {page}, stopping pagination")
-            break
-        
-        # Transform products
-        for product_data in products:
-            transformed = transform_product(product_data)
-            if transformed:
-                all_products.append(transformed)
-        
-        log(f"📄 Page {page}: {len(products)} products (Total: {len(all_products)})")
+            category['failed_pages'].append(page)
+            log(f"❌ {category['name']}: no data for page {page}")
+            if category['last_page'] is None:
+                category['stopped_at'] = page
+            return
         
-        # Stop if we got fewer products than expected (end of data)
-        if len(products) < 50:
-            log(f"📄 Got {len(products)} products (< 50), assuming end of data")
-            break
+        products = extract_products(data)
+        new_count = 0
+        with METRICS.phase('transform'):
+            last_updated = datetime.now().isoformat()
+            for product_data in products:
+                transformed = transformer(product_data, last_updated)
+                if not transformed:
+                    continue
+                if transformed['external_id'] in seen_ids:
+                    category['duplicates'] += 1
+                    continue
+                seen_ids.add(transformed['external_id'])
+                sink.add(transformed)
+                new_count += 1
+        METRICS.count('transform', 'records', len(products))
+        category['pages'] += 1
+        category['products'] += new_count
+        
+        log(f"📄 {category['name']} page {page}: {len(products)} products, {new_count} new "
+            f"(Total: {sink.total})")
+        
+        if len(products) < PAGE_SIZE:
+            # Short or empty page: end of this category
+            if category['stopped_at'] is None or page < category['stopped_at']:
+                category['stopped_at'] = page
+            return
         
-        page += 1
-        time.sleep(DELAY_BETWEEN_BATCHES)
+        if page == 1:
+            last_page = page_count_hint(data)
+            if last_page is not None:
+                category['last_page'] = min(last_page, MAX_PAGES_PER_CATEGORY)
+                enqueue(key, list(range(2, category['last_page'] + 1)))
+            else:
+                category['next_page'] = min(2 + SPECULATIVE_PAGES, MAX_PAGES_PER_CATEGORY + 1)
+                enqueue(key, list(range(2, category['next_page'])))
+        elif category['last_page'] is None and category['stopped_at'] is None \
+                and category['next_page'] <= MAX_PAGES_PER_CATEGORY:
+            enqueue(key, [category['next_page']])
+            category['next_page'] += 1
+    
+    fill()
+    while pending:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            key, page = pending.pop(future)
+            add_page(key, page, future.result())
+        sink.maybe_write_stats()
+        fill()
+        METRICS.gauge('list', 'queued_pages', len(pending) + sum(len(queue) for queue in queues.values()))
     
-    return all_products
+    duplicates = sum(category['duplicates'] for category in state.values())
+    if duplicates:
+        log(f"🔁 Skipped {duplicates} products already seen in another category")
+    
+    transform_summary = transformer.summary()
+    METRICS.count('transform', 'fast_path', transform_summary['fast'])
+    METRICS.count('transform', 'generic_path', transform_summary['generic'])
+    log(f"⚡ Transform: {transform_summary['fast']} via {transform_summary['layouts']} compiled layout(s), "
+        f"{transform_summary['generic']} generic")
+    
+    category_stats = {
+        str(category['name']): {
+            'id': category['id'],
+            'pages': category['pages'],
+            'products': category['products'],
+            'duplicates': category['duplicates'],
+            'failed_pages': category['failed_pages']
+        }
+        for category in state.values()
+    }
+    return category_stats
+
+# Candidate source keys per field, in priority order
+PRICE_KEYS = ('price', 'currentPrice', 'salePrice', 'unitPrice')
+ORIGINAL_PRICE_KEYS = ('originalPrice', 'listPrice', 'regularPrice')
+MAX_COMPILED_SHAPES = 64  # Distinct record layouts per endpoint before falling back to the generic transform
 
 def transform_product(product_data: Dict) -> Optional[Dict]:
-    """Transform raw product data to our schema"""
+    """Transform raw product data to our schema (generic path, probes every fallback key)"""
     try:
         # Handle nested product data
         product = product_data.get('product', product_data)
@@ -322,8 +706,7 @@ def transform_product(product_data: Dict) -> Optional[Dict]:
         on_sale = False
         
         # Try different price fields
-        price_fields = ['price', 'currentPrice', 'salePrice', 'unitPrice']
-        for field in price_fields:
+        for field in PRICE_KEYS:
             if field in product and product[field] is not None:
                 try:
                     current_price = float(product[field])
@@ -332,8 +715,7 @@ def transform_product(product_data: Dict) -> Optional[Dict]:
                     continue
         
         # Check for original/list price
-        orig_price_fields = ['originalPrice', 'listPrice', 'regularPrice']
-        for field in orig_price_fields:
+        for field in ORIGINAL_PRICE_KEYS:
             if field in product and product[field] is not None:
                 try:
                     original_price = float(product[field])
@@ -368,38 +750,125 @@ def transform_product(product_data: Dict) -> Optional[Dict]:
         log(f"❌ Transform error: {e}")
         return None
 
-def save_results(products: List[Dict], stats: Dict):
-    """Save results to JSON files"""
-    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M")
+def or_expression(keys: Tuple, shape: frozenset, fallback: str) -> str:
+    """Source for `p.get(k1) or ... or <fallback>` that only reads the keys the layout has"""
+    return ' or '.join([f"p[{key!r}]" for key in keys if key in shape] + [fallback])
+
+def last_value(key: str, shape: frozenset) -> str:
+    """Source for `p.get(key)`: the value itself (even if falsy) or None when the layout lacks the key"""
+    return f"p[{key!r}]" if key in shape else 'None'
+
+def float_statements(target: str, keys: Tuple, shape: frozenset) -> List[str]:
+    """Source setting `target` to the first present key whose value parses as a float (else None)"""
+    lines = [f"{target} = None"]
+    for key in keys:
+        if key not in shape:
+            continue
+        lines += [
+            f"if {target} is None and p[{key!r}] is not None:",
+            f"    try:",
+            f"        {target} = float(p[{key!r}])",
+            f"    except (ValueError, TypeError):",
+            f"        pass"
+        ]
+    return lines
+
+def compile_transform(shape: frozenset):
+    """Generate a transform specialised to one record layout (the set of keys its records have).
     
-    # Ensure output directory exists
-    os.makedirs("scraped-data", exist_ok=True)
+    The generated function returns exactly what transform_product does for
+    records with these keys, but every fallback chain is resolved when the
+    layout is first seen: absent keys are dropped and present ones are read
+    directly. Only our own key names end up in the source, never record data.
+    It takes the product dict and the last_updated stamp.
+    """
+    if not shape & {'id', 'productId', 'barcode', 'name', 'title'}:
+        return lambda p, last_updated: None
     
-    # Save products
-    products_file = f"scraped-data/rema-products-{timestamp}.json"
-    with open(products_file, 'w', encoding='utf-8') as f:
-        json.dump(products, f, indent=2, ensure_ascii=False)
+    sku = "p['sku']" if 'sku' in shape else repr('')
+    available = ' and '.join(f"p[{key!r}]" if key in shape else 'True' for key in ('available', 'inStock'))
+    body = [
+        f"external_id = str({or_expression(('id', 'productId', 'barcode'), shape, sku)})",
+        "if not external_id:",
+        "    return None",
+        *float_statements('current_price', PRICE_KEYS, shape),
+        *float_statements('original_price', ORIGINAL_PRICE_KEYS, shape),
+        "return {",
+        "    'external_id': external_id,",
+        f"    'name': {or_expression(('name', 'title', 'displayName'), shape, repr('Unknown Product'))},",
+        f"    'category': {or_expression(('category', 'categoryName', 'department'), shape, repr('Uncategorized'))},",
+        "    'price': current_price,",
+        "    'original_price': original_price,",
+        "    'on_sale': bool(current_price) and original_price is not None and original_price > current_price,",
+        f"    'description': {or_expression(('description',), shape, last_value('shortDescription', shape))},",
+        f"    'brand': {or_expression(('brand',), shape, last_value('manufacturer', shape))},",
+        f"    'image_url': {or_expression(('imageUrl', 'image'), shape, last_value('thumbnail', shape))},",
+        f"    'available': {available},",
+        "    'last_updated': last_updated,",
+        "    'source': 'rema1000'",
+        "}"
+    ]
+    source = "def transform(p, last_updated):\n" + "\n".join(f"    {line}" for line in body)
+    namespace = {}
+    exec(compile(source, '<compiled transform>', 'exec'), namespace)
+    return namespace['transform']
+
+class ProductTransformer:
+    """Fast path for transform_product on one endpoint's records.
+    
+    Each record layout (its key set, nearly always one per endpoint) is
+    detected the first time it is seen and gets a compiled transform; records
+    with anything unusual (non-dict payloads, too many layouts) take the
+    generic transform_product path, so results are identical either way.
+    """
     
-    # Save stats  
-    stats_file = f"scraped-data/rema-stats-{timestamp}.json"
-    with open(stats_file, 'w', encoding='utf-8') as f:
-        json.dump(stats, f, indent=2, ensure_ascii=False)
+    def __init__(self):
+        self.compiled = {}
+        self.calls = 0
+        self.generic = 0
     
-    log(f"📁 Results saved:")
-    log(f"   • Products: {products_file}")
-    log(f"   • Stats: {stats_file}")
+    def __call__(self, product_data: Dict, last_updated: str = None) -> Optional[Dict]:
+        self.calls += 1
+        product = product_data.get('product', product_data) if isinstance(product_data, dict) else None
+        if not isinstance(product, dict):
+            self.generic += 1
+            return transform_product(product_data)
+        
+        layout = frozenset(product)  # Key order does not change the compiled code
+        transform = self.compiled.get(layout)
+        if transform is None:
+            if len(self.compiled) >= MAX_COMPILED_SHAPES:
+                self.generic += 1
+                return transform_product(product_data)
+            transform = self.compiled[layout] = compile_transform(layout)
+        
+        try:
+            return transform(product, last_updated or datetime.now().isoformat())
+        except Exception as e:
+            log(f"❌ Transform error: {e}")
+            return None
+    
+    def summary(self) -> Dict:
+        return {'layouts': len(self.compiled), 'fast': self.calls - self.generic, 'generic': self.generic}
+
+def save_metrics(timestamp: str, stats: Dict):
+    """Write the per-phase run metrics next to the results"""
+    metrics_file = f"scraped-data/rema-metrics-{timestamp}.json"
+    METRICS.write_json(metrics_file, {'retries': stats['retries'], 'rate_control': stats['rate_control']})
+    log(f"   • Metrics: {metrics_file}")
+    if PROMETHEUS_FILE:
+        METRICS.write_prometheus(PROMETHEUS_FILE)
+        log(f"   • Prometheus: {PROMETHEUS_FILE}")
 
 def main():
     """Main scraping function"""
     log("🚀 Starting Zyte-powered REMA 1000 scraper...")
-    start_time = time.time()
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M")
     
     try:
-        # Step 1: Discover API endpoints
-        discovered_endpoints = discover_api_endpoints()
-        
-        # Step 2: Find working product/category endpoints
-        working_endpoints = find_product_endpoints(discovered_endpoints)
+        # Steps 1-2: Discover (or reuse cached) product/category endpoints
+        with METRICS.phase('discover'):
+            working_endpoints, discovered_endpoints, endpoints_cached = resolve_endpoints()
         
         if not working_endpoints:
             log("❌ No working API endpoints found!")
@@ -407,47 +876,53 @@ def main():
         
         log(f"✅ Working endpoints: {working_endpoints}")
         
-        # Step 3: Scrape categories (if endpoint available)
-        categories = []
-        if 'categories' in working_endpoints:
-            categories = scrape_categories(working_endpoints['categories'])
-        
-        # Step 4: Scrape products
-        all_products = []
-        
-        if 'products' in working_endpoints:
-            products_url = working_endpoints['products']
-            
-            if categories:
-                # Scrape by category
-                for category in categories[:10]:  # Limit for testing
-                    log(f"🏷️ Scraping category: {category.get('name', 'Unknown')}")
-                    category_products = scrape_products_paginated(
-                        products_url, 
-                        str(category.get('id', ''))
-                    )
-                    all_products.extend(category_products)
-                    time.sleep(DELAY_BETWEEN_BATCHES)
-            else:
-                # Scrape all products
-                log("🛒 Scraping all products...")
-                all_products = scrape_products_paginated(products_url)
-        
-        # Step 5: Generate statistics
-        scrape_time = time.time() - start_time
-        stats = {
-            'timestamp': datetime.now().isoformat(),
-            'scrape_time_seconds': round(scrape_time, 2),
-            'total_products': len(all_products),
-            'products_on_sale': sum(1 for p in all_products if p.get('on_sale')),
-            'categories': len(set(p.get('category', 'Unknown') for p in all_products)),
-            'average_price': round(sum(p.get('price', 0) for p in all_products if p.get('price')) / len(all_products), 2) if all_products else 0,
+        # Products are streamed to disk as pages arrive; the stats file follows along
+        sink = ResultsSink(timestamp, OUTPUT_COMPRESSION)
+        sink.context.update({
             'working_endpoints': working_endpoints,
-            'discovered_endpoints': discovered_endpoints
-        }
-        
-        # Step 6: Save results
-        save_results(all_products, stats)
+            'discovered_endpoints': discovered_endpoints,
+            'endpoints_from_cache': endpoints_cached
+        })
+        log(f"📁 Streaming products to {sink.products_file} (stats: {sink.stats_file})")
+        sink.write_stats('running')
+        
+        try:
+            with METRICS.phase('list'):
+                # Step 3: Scrape categories (if endpoint available)
+                categories = []
+                if 'categories' in working_endpoints:
+                    categories = scrape_categories(working_endpoints['categories'])
+                
+                # Step 4: Scrape products
+                category_stats = {}
+                
+                if 'products' in working_endpoints:
+                    products_url = working_endpoints['products']
+                    
+                    if categories:
+                        # Scrape every category concurrently
+                        log(f"🏷️ Scraping {len(categories)} categories in parallel...")
+                        category_stats = scrape_products(products_url, categories, sink)
+                    else:
+                        # Scrape all products
+                        log("🛒 Scraping all products...")
+                        category_stats = scrape_products(products_url, [{'id': None, 'name': 'All products'}], sink)
+        except BaseException:
+            sink.close()
+            sink.write_stats('failed')
+            raise
+        
+        # Steps 5-6: Close the output and write final statistics
+        sink.close()
+        stats = sink.write_stats('complete', {
+            'duplicates_skipped': sum(category['duplicates'] for category in category_stats.values()),
+            'category_stats': category_stats
+        })
+        
+        log(f"📁 Results saved:")
+        log(f"   • Products: {sink.products_file}")
+        log(f"   • Stats: {sink.stats_file}")
+        save_metrics(timestamp, stats)
         
         # Step 7: Display summary
         log("✅ Scraping completed!")
@@ -457,6 +932,9 @@ def main():
         log(f"   • Categories: {stats['categories']}")
         log(f"   • Average Price: {stats['average_price']} DKK")
         log(f"   • Scrape Time: {stats['scrape_time_seconds']}s")
+        log(f"   • Retries: {stats['retries']['retries']} (gave up {stats['retries']['gave_up']})")
+        RATE_CONTROLLER.print_summary(log)
+        METRICS.print_summary(log)
         
         if stats['total_products'] == 0:
             log("❌ No products were scraped. Check endpoints and response structure.")